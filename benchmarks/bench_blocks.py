@@ -0,0 +1,66 @@
+"""
+Block execution with netting against making every trade: one path of
+trades run in blocks, netted (one invariant solve per block) and trade by
+trade (history merged to the same blocks). Reports the time taken and how
+far the netted block prices and burns are from the exact ones.
+
+    python benchmarks/bench_blocks.py [--amm curve] [--block-size 50]
+                                      [--nobs 20000] [--seed 0]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.blocks import simulate_blocks
+from src.runner import draw_trades
+from src.tax_functions import no_tax, quadratic_tax
+
+
+TAX_FUNCTIONS = dict({
+    'no_tax': no_tax,
+    'quadratic_tax': quadratic_tax,
+    'slippage': "slippage",
+})
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--amm', default='curve', choices=['uniswap', 'curve'])
+    parser.add_argument('--block-size', type=int, default=50)
+    parser.add_argument('--nobs', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    A = 20 if args.amm == 'curve' else None
+    # the curve_vs_uniswap scenario's pool and trades
+    trades = draw_trades(-1000, 15000, 1, args.nobs, np.random.default_rng(args.seed))[0]
+
+    print("{} trades in blocks of {} on {}".format(args.nobs, args.block_size, args.amm))
+    for tax_style, tax_function in TAX_FUNCTIONS.items():
+        pools = dict({})
+        seconds = dict({})
+        for netting in [False, True]:
+            start = time.perf_counter()
+            pools[netting] = simulate_blocks(
+                args.amm, tax_function, 11_000_000, 11_000_000, trades,
+                block_size=args.block_size, netting=netting, A=A,
+            )
+            seconds[netting] = time.perf_counter() - start
+        exact, netted = pools[False].history, pools[True].history
+        price_error = np.max(np.abs(np.asarray(exact['prices']) - np.asarray(netted['prices'])))
+        # relative, untaxed runs burn nothing either way
+        burn_error = abs(np.sum(netted['burns']) - np.sum(exact['burns'])) / max(np.sum(exact['burns']), 1)
+        print("{:<14} trade by trade {:6.2f} s   netted {:6.3f} s   price error {:.1e}   total burn error {:.1e}".format(
+            tax_style,
+            seconds[False],
+            seconds[True],
+            price_error,
+            burn_error,
+        ))
@@ -0,0 +1,86 @@
+"""
+Several tax styles on the same trades, run separately with simulate_path()
+and together as SimulationTrees that share one pool until the styles'
+sells diverge. Checks that both give identical histories, and reports the
+trades made and the time taken by each.
+
+    python benchmarks/bench_branching.py [--amm uniswap] [--mu 3000] [--sigma 5000]
+                                         [--nobs 5000] [--paths 8] [--seed 0]
+
+The sharing pays off while the pool trades above the peg, where
+quadratic_tax and no_tax burn nothing; below it every taxed sell splits
+the tree and the styles run separately.
+
+Exits with status 1 if a tax style's history differs.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.branching import simulate_tax_styles
+from src.runner import draw_trades, simulate_path
+from src.tax_functions import no_tax, quadratic_tax
+
+
+def double_quadratic_tax(price, dsd_amount):
+    return 2 * quadratic_tax(price, dsd_amount)
+
+
+TAX_FUNCTIONS = dict({
+    'no_tax': no_tax,
+    'quadratic_tax': quadratic_tax,
+    'double_quadratic_tax': double_quadratic_tax,
+    'slippage': "slippage",
+})
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--amm', default='uniswap', choices=['uniswap', 'curve'])
+    parser.add_argument('--mu', type=float, default=3000)
+    parser.add_argument('--sigma', type=float, default=5000)
+    parser.add_argument('--nobs', type=int, default=5000)
+    parser.add_argument('--paths', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    A = 100 if args.amm == 'curve' else None
+    trades = draw_trades(args.mu, args.sigma, args.paths, args.nobs, np.random.default_rng(args.seed))
+
+    start = time.perf_counter()
+    outputs, swaps = simulate_tax_styles(
+        args.amm, TAX_FUNCTIONS, 1_000_000, 1_000_000, args.mu, args.sigma, args.nobs, args.paths, A=A, trades=trades,
+    )
+    tree_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    separate = dict({
+        tax_style: [
+            simulate_path(args.amm, tax_function, 1_000_000, 1_000_000, args.mu, args.sigma, args.nobs, A=A, trades=path)[0]
+            for path in trades
+        ]
+        for tax_style, tax_function in TAX_FUNCTIONS.items()
+    })
+    separate_seconds = time.perf_counter() - start
+
+    failed = []
+    for tax_style, pools in separate.items():
+        histories = outputs[tax_style][0]
+        for pool, history in zip(pools, histories):
+            if not all(np.array_equal(np.asarray(pool.history[m], dtype=float), np.asarray(history[m], dtype=float)) for m in pool.history):
+                failed.append(tax_style)
+                break
+
+    print("{} tax styles x {} paths x {} trades on {}".format(len(TAX_FUNCTIONS), args.paths, args.nobs, args.amm))
+    print("separate runs   {:>9} trades   {:6.2f} s".format(len(TAX_FUNCTIONS) * args.paths * args.nobs, separate_seconds))
+    print("shared prefixes {:>9} trades   {:6.2f} s".format(swaps, tree_seconds))
+    if failed:
+        print("FAILED: histories differ for {}".format(", ".join(failed)))
+        sys.exit(1)
@@ -0,0 +1,62 @@
+"""
+Event throughput of the simulation clock (src/events.py): the scheduler
+on its own, with periodic events that do nothing, and driving a pool with
+Poisson trade arrivals, epochs and a time grid.
+
+    python benchmarks/bench_events.py [--amm uniswap] [--trades 1000000] [--seed 0]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.events import Scheduler, simulate_events
+from src.tax_functions import quadratic_tax
+
+
+
+def scheduler_throughput(num_events, num_sources=100):
+    """events per second of num_sources periodic events that do nothing"""
+    scheduler = Scheduler()
+    for source in range(num_sources):
+        scheduler.every(1 + source / num_sources, lambda scheduler, time: None)
+    start = time.perf_counter()
+    # about num_events events over all sources
+    scheduler.run(num_events / num_sources)
+    return scheduler.events / (time.perf_counter() - start)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--amm', default='uniswap', choices=['uniswap', 'curve'])
+    parser.add_argument('--trades', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print("scheduler alone: {:6.2f}M events/min".format(scheduler_throughput(args.trades) * 60 / 1e6))
+
+    # 1000 trades per unit time, an epoch every 8 and a grid point every 1
+    rate = 1000
+    start = time.perf_counter()
+    pool, recorded, scheduler = simulate_events(
+        args.amm, quadratic_tax, 11_000_000, 11_000_000, -1000, 15000,
+        rate, args.trades / rate, 1.0,
+        A=20,
+        rng=np.random.default_rng(args.seed),
+        protocol_events=[(8.0, lambda scheduler, time: None)],
+    )
+    seconds = time.perf_counter() - start
+    print("{} pool:     {:6.2f}M events/min   ({} events, {} trades, {} grid points, {:.1f} s)".format(
+        args.amm,
+        scheduler.events / seconds * 60 / 1e6,
+        scheduler.events,
+        len(pool.history['prices']) - 1,
+        len(recorded['times']),
+        seconds,
+    ))
@@ -0,0 +1,92 @@
+"""
+Startup time of the simulation modules, and a guard that importing them
+does not load matplotlib, pandas or mplfinance: every worker process and
+CLI invocation pays this before doing any math.
+
+    python benchmarks/bench_startup.py [--repeat 5]
+
+Exits with status 1 if a heavy module gets imported.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must import with NumPy only
+CORE_MODULES = [
+    'src.random',
+    'src.tax_functions',
+    'src.curve_amm',
+    'src.uniswap_amm',
+    'src.ensemble',
+    'src.runner',
+    'src.scenario',
+    'src.sweep',
+]
+
+HEAVY_MODULES = ['matplotlib', 'pandas', 'mplfinance']
+
+
+
+def run_python(code):
+    """runs code in a fresh interpreter from the repo root, returns stdout"""
+    return subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def loaded_heavy_modules(module):
+    """heavy modules in sys.modules after importing module"""
+    code = "import sys, {}; print(' '.join(m for m in {} if m in sys.modules))".format(
+        module,
+        HEAVY_MODULES,
+    )
+    return run_python(code).split()
+
+
+def import_time(module, repeat):
+    """best wall time over repeat fresh interpreters of importing module, in seconds"""
+    code = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)".format(module)
+    return min(float(run_python(code)) for _ in range(repeat))
+
+
+def interpreter_time(repeat):
+    """best wall time of starting and stopping a bare interpreter, for reference"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_python("pass")
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per module, best time is shown")
+    args = parser.parse_args()
+
+    print("interpreter start: {:.1f} ms".format(interpreter_time(args.repeat) * 1000))
+    failed = []
+    for module in CORE_MODULES:
+        heavy = loaded_heavy_modules(module)
+        print("import {:<18} {:7.1f} ms   {}".format(
+            module,
+            import_time(module, args.repeat) * 1000,
+            "loads " + ", ".join(heavy) if heavy else "ok",
+        ))
+        if heavy:
+            failed.append(module)
+
+    if failed:
+        print("FAILED: {} import plotting libraries eagerly".format(", ".join(failed)))
+        sys.exit(1)
@@ -0,0 +1,162 @@
+"""
+Pins the pools' slippage-tax sells against a high-precision reference:
+the same Curve equations (get_D()'s invariant, get_y()'s quadratic) solved
+with 50 significant digits in Decimal, and Uniswap's x * y = k.
+
+Each sale of a random sequence is replayed by the reference from the
+pool's state before it, and the balances, burn and recorded price after
+it are compared. Also times the sells.
+
+    python benchmarks/check_slippage_tax.py [--trades 2000] [--seed 0]
+
+Exits with status 1 if a sale is off by more than the tolerances.
+"""
+
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal, getcontext
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.curve_amm import Curve
+from src.uniswap_amm import Uniswap
+
+
+getcontext().prec = 50
+
+# relative error allowed in balances and burns, absolute error in prices:
+# the float solvers stop once an iteration moves by less than PRECISION2
+TOLERANCES = dict({
+    'balance_x': 1e-8,
+    'balance_y': 1e-8,
+    'burn': 1e-7,
+    'price': 1e-6,
+})
+
+
+
+def reference_D(x, y, A):
+    """get_D() for 2 coins, iterated until D stops changing in 50 digits"""
+    S = x + y
+    D = S
+    Ann = A * 2
+    for _i in range(1000):
+        D_P = D * D / (x * 2 + 1) * D / (y * 2 + 1)
+        Dprev = D
+        D = (Ann * S + D_P * 2) * D / ((Ann - 1) * D + 3 * D_P)
+        if abs(D - Dprev) < Decimal('1e-40'):
+            break
+    return D
+
+
+def reference_y(x, D, A):
+    """the root of get_y()'s quadratic y**2 + (b - D) * y = c, for 2 coins"""
+    Ann = A * 2
+    c = D * D / (x * 2) * D / (Ann * 2)
+    b = x + D / Ann
+    return (-(b - D) + ((b - D) ** 2 + 4 * c).sqrt()) / 2
+
+
+def reference_curve_sale(x, y, A, dsd, treasury_tax_rate):
+    """Curve.sell_dsd_slippage_tax() from balances (x, y)"""
+    D = reference_D(x, y, A)
+    # untaxed sale, slippage and burn
+    slippage = abs(x - reference_y(y + dsd, D, A)) / dsd
+    burn = (1 - slippage) * dsd if slippage < 1 else Decimal(0)
+    leftover_dsd = dsd - burn
+    after_x = reference_y(y + leftover_dsd, D, A)
+    after_y = y + leftover_dsd
+    # get_virtual_price(): selling 10 more DSD
+    D = reference_D(after_x, after_y, A)
+    price = (after_x - reference_y(after_y + 10, D, A)) / 10
+    return dict({
+        'balance_x': after_x,
+        'balance_y': after_y,
+        'burn': (1 - treasury_tax_rate) * burn,
+        'price': price,
+    })
+
+
+def reference_uniswap_sale(x, y, k, dsd, treasury_tax_rate):
+    """Uniswap.sell_dsd_slippage_tax() from balances (x, y)"""
+    slippage = abs(x - k / (y + dsd)) / dsd
+    burn = (1 - slippage) * dsd if slippage < 1 else Decimal(0)
+    after_y = y + dsd - burn
+    after_x = k / after_y
+    return dict({
+        'balance_x': after_x,
+        'balance_y': after_y,
+        'burn': (1 - treasury_tax_rate) * burn,
+        'price': after_x / after_y,
+    })
+
+
+def check(pool, amounts, reference):
+    """
+    sells amounts with the pool's slippage tax, checking every sale against
+    reference(x, y, dsd). Returns (worst error of each field, seconds selling)
+    """
+    worst = dict({ field: 0.0 for field in TOLERANCES })
+    seconds = 0
+    for dsd in amounts:
+        x, y = Decimal(pool.balance_x), Decimal(pool.balance_y)
+        start = time.perf_counter()
+        price = pool.sell_dsd_slippage_tax(dsd)
+        seconds += time.perf_counter() - start
+
+        expected = reference(x, y, Decimal(dsd))
+        actual = dict({
+            'balance_x': pool.balance_x,
+            'balance_y': pool.balance_y,
+            'burn': pool.history['burns'][-1],
+            'price': price,
+        })
+        for field, value in actual.items():
+            error = abs(Decimal(value) - expected[field])
+            if field != 'price':
+                error = error / max(abs(expected[field]), Decimal(1))
+            worst[field] = max(worst[field], float(error))
+    return worst, seconds
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trades', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # sales of 1 to 20 DSD, drifting the pool well below the peg
+    amounts = rng.uniform(1, 20, args.trades)
+
+    curve = Curve(1200, 400, A=100)
+    uniswap = Uniswap(1200, 400)
+    checks = [
+        ('curve', curve, lambda x, y, dsd: reference_curve_sale(
+            x, y, Decimal(curve.A), dsd, Decimal(curve.treasury_tax_rate),
+        )),
+        ('uniswap', uniswap, lambda x, y, dsd: reference_uniswap_sale(
+            x, y, Decimal(uniswap.k), dsd, Decimal(uniswap.treasury_tax_rate),
+        )),
+    ]
+
+    failed = False
+    for name, pool, reference in checks:
+        worst, seconds = check(pool, amounts, reference)
+        print("{:<8} {:8.1f} us/sell   final price {:.6f}".format(
+            name,
+            seconds / len(amounts) * 1e6,
+            pool.history['prices'][-1],
+        ))
+        for field, error in worst.items():
+            ok = error <= TOLERANCES[field]
+            failed = failed or not ok
+            print("    {:<10} worst error {:.2e}   {}".format(field, error, "ok" if ok else "FAILED"))
+
+    if failed:
+        sys.exit(1)
@@ -1,10 +1,5 @@
 
 import numpy as np
-import pandas as pd
-# plots
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-import mplfinance as fplt
 
 
 # rates: uint256[N_COINS] -> uint256[N_COINS];
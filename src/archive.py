@@ -0,0 +1,241 @@
+
+import argparse
+import json
+import os
+import struct
+import zlib
+import numpy as np
+
+from src.results_store import ResultsStore
+
+
+MAGIC = b'DSDARC01'
+
+# paths per compressed block, the unit of random access
+DEFAULT_BLOCK_ROWS = 64
+
+# zlib level, higher levels barely shrink noisy float bits further but are much slower
+DEFAULT_LEVEL = 1
+
+# unsigned integer type with the same width as each float type
+INT_TYPES = dict({ 'f4': np.uint32, 'f8': np.uint64 })
+
+
+
+# transform applied to each value's bits before compression:
+#   xor: XOR with the previous value, consecutive values of a path are close
+#       so their sign, exponent and high mantissa bits cancel out
+#   delta: difference with the previous value's bits, as integers
+#   raw: none, best for mostly-zero series like burns
+TRANSFORMS = ['xor', 'delta', 'raw']
+
+# encodings tried on a metric's first block, the smallest is used for all of them.
+# shuffled: the bytes are grouped by position (all first bytes, then all second
+# bytes, ...) so the zeroed high bytes form long runs
+ENCODINGS = [
+    "{}{}".format(transform, shuffle)
+    for transform in TRANSFORMS for shuffle in ['+shuffle', '']
+]
+
+
+
+def encode_block(values, encoding='xor+shuffle', level=DEFAULT_LEVEL):
+    """Losslessly compresses a (paths, steps) float block, paths one after the other"""
+    values = np.ascontiguousarray(values)
+    transform = encoding.split('+')[0]
+    bits = values.reshape(-1).view(INT_TYPES[values.dtype.str[1:]])
+    coded = bits.copy()
+    if transform == 'xor':
+        coded[1:] ^= bits[:-1]
+    elif transform == 'delta':
+        coded[1:] -= bits[:-1]
+    data = coded.view(np.uint8).reshape(-1, values.dtype.itemsize)
+    if encoding.endswith('+shuffle'):
+        data = data.T
+    return zlib.compress(data.tobytes(), level)
+
+
+def decode_block(data, shape, dtype, encoding='xor+shuffle'):
+    """inverse of encode_block()"""
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape))
+    transform = encoding.split('+')[0]
+    data = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    if encoding.endswith('+shuffle'):
+        data = data.reshape(dtype.itemsize, size).T
+    coded = np.ascontiguousarray(data).view(INT_TYPES[dtype.str[1:]]).reshape(-1)
+    if transform == 'xor':
+        coded = np.bitwise_xor.accumulate(coded)
+    elif transform == 'delta':
+        coded = np.cumsum(coded, dtype=coded.dtype)
+    return coded.view(dtype).reshape(shape)
+
+
+def choose_encoding(values, level=DEFAULT_LEVEL):
+    """the encoding that compresses values the most"""
+    return min(ENCODINGS, key=lambda encoding: len(encode_block(values, encoding, level)))
+
+
+
+def export_store(store, path, block_rows=DEFAULT_BLOCK_ROWS, level=DEFAULT_LEVEL):
+    """
+    Writes every finished path of a ResultsStore to a single archive file:
+        MAGIC, compressed blocks..., JSON index, index offset (8 bytes)
+    Each metric is split into blocks of block_rows paths, compressed
+    separately so they can be decoded on their own, see Archive.
+    Compression is lossless; archiving a float32 store halves the size again.
+    Pyramid levels are not archived, only which metrics had them, and
+    import_store() rebuilds them.
+    """
+    index = dict({ 'block_rows': block_rows, 'series': dict({}) })
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC)
+        for series in store.series():
+            index['series'][series] = dict({})
+            for metric in store.metrics(series):
+                matrix = store.read(series, metric)
+                encoding = choose_encoding(np.asarray(matrix[:block_rows]), level)
+                blocks = []
+                for start in range(0, len(matrix), block_rows):
+                    data = encode_block(np.asarray(matrix[start:start + block_rows]), encoding, level)
+                    blocks.append([f.tell(), len(data)])
+                    f.write(data)
+                index['series'][series][metric] = dict({
+                    'shape': list(matrix.shape),
+                    'dtype': matrix.dtype.str,
+                    'encoding': encoding,
+                    'blocks': blocks,
+                    # rebuilt on import, see ResultsStore.build_pyramid()
+                    'levels': 'levels' in store.manifest['series'][series][metric],
+                })
+        offset = f.tell()
+        f.write(json.dumps(index).encode())
+        f.write(struct.pack('<Q', offset))
+    os.replace(path + '.tmp', path)
+    return path
+
+
+
+class Archive:
+    """
+    Reads an archive written by export_store(), decoding only the blocks
+    that hold the requested paths.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a results archive".format(path))
+            f.seek(-8, os.SEEK_END)
+            end = f.tell()
+            offset = struct.unpack('<Q', f.read(8))[0]
+            f.seek(offset)
+            self.index = json.loads(f.read(end - offset))
+        self.block_rows = self.index['block_rows']
+
+
+    def __repr__(self):
+        return "Archive(path={}, series={})".format(self.path, len(self.index['series']))
+
+
+    def series(self):
+        return list(self.index['series'].keys())
+
+
+    def metrics(self, series):
+        return list(self.index['series'][series].keys())
+
+
+    def shape(self, series, metric):
+        return tuple(self.index['series'][series][metric]['shape'])
+
+
+    def read_block(self, series, metric, block):
+        """the paths of one block, block * block_rows onwards"""
+        entry = self.index['series'][series][metric]
+        offset, length = entry['blocks'][block]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        rows = min(self.block_rows, entry['shape'][0] - block * self.block_rows)
+        return decode_block(data, (rows, entry['shape'][1]), entry['dtype'], entry['encoding'])
+
+
+    def read(self, series, metric, start=0, stop=None):
+        """paths [start:stop] of a metric"""
+        num_paths, num_steps = self.shape(series, metric)
+        stop = num_paths if stop is None else min(stop, num_paths)
+        if stop <= start:
+            return np.zeros((0, num_steps), dtype=self.index['series'][series][metric]['dtype'])
+        first, last = start // self.block_rows, (stop - 1) // self.block_rows
+        blocks = np.concatenate([
+            self.read_block(series, metric, block) for block in range(first, last + 1)
+        ])
+        return blocks[start - first * self.block_rows:stop - first * self.block_rows]
+
+
+    def paths(self, series):
+        """dict of metric -> every path, like results['paths']"""
+        return dict({ metric: self.read(series, metric) for metric in self.metrics(series) })
+
+
+
+def import_store(path, root):
+    """unpacks an archive into a ResultsStore at root, rebuilding its pyramid levels"""
+    archive = Archive(path)
+    store = None
+    for series in archive.series():
+        for metric in archive.metrics(series):
+            num_paths, num_steps = archive.shape(series, metric)
+            dtype = archive.index['series'][series][metric]['dtype']
+            if store is None:
+                store = ResultsStore(root, dtype)
+            file = store.create(series, metric, num_paths, num_steps)
+            matrix = np.load(file, mmap_mode='r+')
+            for block in range(len(archive.index['series'][series][metric]['blocks'])):
+                start = block * archive.block_rows
+                values = archive.read_block(series, metric, block)
+                matrix[start:start + len(values)] = values
+            matrix.flush()
+            del matrix
+            # metrics of a series can hold different numbers of paths, e.g. averages
+            store.manifest['series'][series][metric]['rows'] = num_paths
+            store.save_manifest()
+            if archive.index['series'][series][metric].get('levels', False):
+                store.build_pyramid(series, metric)
+    return store or ResultsStore(root)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive a results store, or unpack an archive")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="compresses a results store")
+    export.add_argument('store', help="results store directory")
+    export.add_argument('archive', help="archive file to write")
+    export.add_argument('--block-rows', type=int, default=DEFAULT_BLOCK_ROWS, help="paths per block")
+    export.add_argument('--level', type=int, default=DEFAULT_LEVEL, help="zlib compression level")
+
+    unpack = commands.add_parser('import', help="unpacks an archive into a results store")
+    unpack.add_argument('archive', help="archive file")
+    unpack.add_argument('store', help="results store directory to create")
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        export_store(ResultsStore(args.store), args.archive, args.block_rows, args.level)
+        store_size = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, names in os.walk(args.store) for name in names
+        )
+        print("{}: {:.1f}MB -> {:.1f}MB".format(
+            args.archive, store_size / 1024**2, os.path.getsize(args.archive) / 1024**2
+        ))
+    else:
+        print(import_store(args.archive, args.store))
+
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,137 @@
+
+import numpy as np
+
+from src.random import trade_from_amount
+from src.runner import create_pool
+from src.tax_functions import uses_twap
+from src.twap import tax_price
+
+
+def block_bounds(num_trades, block_size=None, times=None, block_time=None):
+    """
+    Splits a stream of trades into blocks, either block_size trades each or
+    every block_time of the trades' times (ascending, from 0). Time blocks
+    are a fixed grid, blocks without trades included.
+    Returns the index of each block's first trade and, last, num_trades:
+    block b holds trades bounds[b]:bounds[b + 1]
+    """
+    if block_time is not None:
+        times = np.asarray(times, dtype=float)
+        num_blocks = int(times[-1] // block_time) + 1 if len(times) else 0
+        edges = block_time * np.arange(num_blocks + 1)
+        bounds = np.searchsorted(times, edges, side='left')
+        bounds[-1] = num_trades
+        return bounds
+    if block_size is None or block_size < 1:
+        raise ValueError("blocks need a block_size of at least 1 trade, or a block_time")
+    return np.append(np.arange(0, num_trades, block_size), num_trades)
+
+
+def block_burns(pool, sells, tax_function):
+    """DSD burnt by the tax on each of a block's sells, all taxed at the block's opening price"""
+    if tax_function == "slippage":
+        # slippage of each sale on its own, one batched solve
+        slippage = np.abs(pool.quote_sell(sells)['slippage'])
+        return np.where(slippage < 1, (1 - slippage) * sells, 0)
+    # what sell_dsd() taxes at, trade_net() records price_oracle() too
+    price = tax_price(pool, tax_function, pool.history['prices'][-1])
+    return np.broadcast_to(tax_function(price=price, dsd_amount=sells), sells.shape)
+
+
+def execute_block(pool, amounts, tax_function, netting=True):
+    """
+    Makes one block of signed trade amounts (buys > 0, sells < 0) and
+    records one step of history for the whole block.
+
+    netting=True: the block's sells are taxed at the opening price, then
+        buys and sells are netted and the pool makes a single trade of
+        what is left, one invariant solve per block (see trade_net()).
+    netting=False: the trades are made one by one, as swap() makes them,
+        and the block's steps are merged into one (last price and treasury
+        balance, total burns), to compare netting against. The TWAP is
+        observed once per block too, so TWAP windows count blocks either
+        way and the block's sells are taxed at its opening TWAP.
+
+    If the block breaks the pool, the block is undone and the path is
+    frozen, as in swap().
+    """
+    if pool.failure is not None or len(amounts) == 0:
+        return pool.carry_forward()
+    if not netting:
+        start = len(pool.history['prices'])
+        twap = pool.twap
+        observed = None if twap is None else twap.snapshot()
+        for amount in amounts:
+            pool.swap(trade_from_amount(amount), tax_function=tax_function)
+            if twap is not None:
+                # one TWAP observation per block, as with netting
+                twap.restore(observed)
+        merge_steps(pool.history, start)
+        if twap is not None:
+            twap.update(pool.history['prices'][-1])
+        return pool.history['prices'][-1]
+
+    amounts = np.asarray(amounts, dtype=float)
+    sells = -amounts[amounts < 0]
+    buys = amounts[amounts >= 0]
+    snapshot = pool.snapshot()
+    try:
+        burns = block_burns(pool, sells, tax_function)
+        assert np.all(burns <= sells), "tax exceeds amount sold"
+        burn = float(np.sum(burns))
+        price_after = pool.trade_net(np.sum(sells) - burn - np.sum(buys), burn)
+    except (AssertionError, ZeroDivisionError) as e:
+        # undo the failed block, then freeze the path
+        pool.restore(snapshot)
+        pool.failure = dict({
+            'step': len(pool.history['prices']) - 1, # index of the failed block
+            'reason': str(e) or type(e).__name__,
+        })
+        return pool.carry_forward()
+
+    if pool.live_candles is not None:
+        pool.live_candles.update(price_after)
+    return price_after
+
+
+def merge_steps(history, start):
+    """merges the history steps from start on into one"""
+    if len(history['prices']) <= start + 1:
+        return
+    burns = history['burns']
+    burnt = sum(burns[step] for step in range(start, len(burns)))
+    for metric, series in history.items():
+        last = burnt if metric == 'burns' else series[-1]
+        del series[start:]
+        series.append(last)
+
+
+def simulate_blocks(
+    amm,
+    tax_function,
+    lp_initial_usdc,
+    lp_initial_dsd,
+    trades,
+    block_size=None,
+    times=None,
+    block_time=None,
+    netting=True,
+    A=None,
+    history=None,
+):
+    """
+    Runs one path of signed trade amounts in blocks, see block_bounds()
+    and execute_block(). The pool's history has one step per block (plus
+    the initial state), so its length is the number of blocks + 1.
+    times, block_time: blocks by time, e.g. the arrival times of the
+        trades, otherwise block_size trades per block
+    Returns the pool
+    """
+    pool = create_pool(amm, lp_initial_usdc, lp_initial_dsd, A, history)
+    if uses_twap(tax_function):
+        # a step per block
+        pool.track_twap()
+    bounds = block_bounds(len(trades), block_size, times, block_time)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        execute_block(pool, trades[start:stop], tax_function, netting)
+    return pool
@@ -0,0 +1,246 @@
+
+import numpy as np
+
+from src.ensemble import absorbed
+from src.random import block_rng, trade_from_amount
+from src.runner import create_pool, draw_trades, summarise_block, write_outputs
+from src.tax_functions import uses_twap
+from src.twap import tax_price
+
+
+class SimulationTree:
+    """
+    Steps several tax styles over the same trades, sharing one pool between
+    every tax style whose state is still the same. Buys are untaxed, and
+    tax functions often agree on sells too (quadratic_tax and no_tax both
+    burn nothing above the peg), so tax styles share one pool until their
+    first sell with different burns. The pool then forks (see Curve.fork()),
+    one branch per distinct outcome, and the branches share the history so far.
+
+    Each tax style ends with the same pool, history and absorption as
+    simulate_path() run on its own over the same trades; tax styles that
+    never diverged share one pool.
+
+    tax_functions: dict of tax_style -> tax function (or "slippage")
+    absorbing, slippage_surface: see simulate_path()
+    """
+
+    def __init__(self,
+        amm,
+        tax_functions,
+        lp_initial_usdc,
+        lp_initial_dsd,
+        A=None,
+        absorbing=None,
+        slippage_surface=None,
+    ):
+        self.tax_functions = tax_functions
+        self.absorbing = absorbing
+        styles = list(tax_functions)
+        if slippage_surface is not None and "slippage" in tax_functions.values():
+            # the surface only changes how the slippage tax is solved, a
+            # pool with one sells like a pool without one for other taxes
+            pool = create_pool(amm, lp_initial_usdc, lp_initial_dsd, A, slippage_surface=slippage_surface)
+        else:
+            pool = create_pool(amm, lp_initial_usdc, lp_initial_dsd, A)
+        if any(uses_twap(tax_function) for tax_function in tax_functions.values()):
+            pool.track_twap()
+        # branches: list of dict({ 'pool', 'styles', 'absorption' })
+        self.branches = [dict({ 'pool': pool, 'styles': styles, 'absorption': None })]
+        self.step = 0
+        # trades made, over every branch
+        self.swaps = 0
+
+
+    def __repr__(self):
+        return "SimulationTree(step={}, branches={}, swaps={})".format(self.step, len(self.branches), self.swaps)
+
+
+    def sale_key(self, pool, tax_style, price, dsd_amount):
+        """
+        what a tax style's sell depends on besides the pool: sell_dsd() is
+        determined by its burn at the pool's price (or TWAP), the slippage
+        tax is its own function
+        """
+        tax_function = self.tax_functions[tax_style]
+        if tax_function == "slippage":
+            return "slippage"
+        try:
+            price = tax_price(pool, tax_function, price)
+            return float(tax_function(price=price, dsd_amount=np.abs(dsd_amount)))
+        except (AssertionError, ZeroDivisionError):
+            # the sell will fail, let the tax style fail on its own branch
+            return ('failed', tax_style)
+
+
+    def split(self, branch, dsd_amount):
+        """splits a branch into one branch per distinct outcome of selling dsd_amount"""
+        pool = branch['pool']
+        if len(branch['styles']) == 1 or pool.failure is not None:
+            return [branch]
+        # the price sell_dsd() will tax at: a branch of several tax styles
+        # has only bought, or sold with sell_dsd(), which record price_oracle()
+        # (the slippage tax records another price, but splits off at its first sell)
+        price = pool.history['prices'][-1]
+        outcomes = dict({})
+        for tax_style in branch['styles']:
+            outcomes.setdefault(self.sale_key(pool, tax_style, price, dsd_amount), []).append(tax_style)
+        if len(outcomes) == 1:
+            return [branch]
+        groups = list(outcomes.values())
+        # the branch keeps its pool for the first outcome, the others fork it
+        return [
+            dict({
+                'pool': pool if i == 0 else pool.fork(),
+                'styles': styles,
+                'absorption': branch['absorption'],
+            })
+            for i, styles in enumerate(groups)
+        ]
+
+
+    def swap(self, trade):
+        """makes one trade on every branch, splitting branches whose tax styles diverge"""
+        if trade['type'] == 'sell':
+            self.branches = [
+                split for branch in self.branches
+                for split in ([branch] if branch['absorption'] is not None else self.split(branch, trade['amount']))
+            ]
+        for branch in self.branches:
+            pool = branch['pool']
+            if branch['absorption'] is not None:
+                pool.carry_forward()
+                continue
+            # tax styles of a branch sell alike, any of them will do
+            pool.swap(trade, tax_function=self.tax_functions[branch['styles'][0]])
+            self.swaps += 1
+            if self.absorbing and pool.failure is None:
+                done, conditions = absorbed(self.absorbing, dict({
+                    'price': pool.history['prices'][-1],
+                    'balance_x': pool.balance_x,
+                    'balance_y': pool.balance_y,
+                    'treasury': pool.history['treasury_balances'][-1],
+                }))
+                if done:
+                    branch['absorption'] = dict({ 'step': self.step, 'reason': conditions[()] })
+        self.step += 1
+
+
+    def run(self, trades):
+        """makes every trade of a sequence of signed trade amounts"""
+        for amount in trades:
+            self.swap(trade_from_amount(amount))
+        return self
+
+
+    def results(self):
+        """dict of tax_style -> (pool, absorption), like simulate_path()"""
+        runs = dict({})
+        for branch in self.branches:
+            for tax_style in branch['styles']:
+                runs[tax_style] = (branch['pool'], branch['absorption'])
+        return dict({ tax_style: runs[tax_style] for tax_style in self.tax_functions })
+
+
+
+def simulate_tax_styles(
+    amm,
+    tax_functions,
+    lp_initial_usdc,
+    lp_initial_dsd,
+    mu,
+    sigma,
+    nobs,
+    num_paths,
+    A=None,
+    absorbing=None,
+    rng=None,
+    trades=None,
+    slippage_surface=None,
+):
+    """
+    simulate_paths() for several tax styles on the same trades, stepping
+    each path as one SimulationTree.
+    tax_functions: dict of tax_style -> tax function (or "slippage")
+    trades: (num_paths, nobs) pregenerated signed trade amounts, otherwise
+        drawn from rng like the serial backend draws them
+    Returns (outputs, swaps): outputs is a dict of tax_style -> (histories,
+    failures, absorptions) as simulate_paths() returns them, and swaps the
+    number of trades made, against len(tax_functions) * num_paths * nobs
+    for separate runs
+    """
+    if trades is None:
+        trades = draw_trades(mu, sigma, num_paths, nobs, rng)
+    outputs = dict({ tax_style: ([], [], []) for tax_style in tax_functions })
+    swaps = 0
+    for i in range(num_paths):
+        tree = SimulationTree(
+            amm,
+            tax_functions,
+            lp_initial_usdc,
+            lp_initial_dsd,
+            A=A,
+            absorbing=absorbing,
+            slippage_surface=slippage_surface,
+        ).run(trades[i])
+        swaps += tree.swaps
+        for tax_style, (pool, absorption) in tree.results().items():
+            histories, failures, absorptions = outputs[tax_style]
+            histories.append(pool.history)
+            failures.append(pool.failure)
+            absorptions.append(absorption)
+    return outputs, swaps
+
+
+
+def run_shared_pool(runs, seed, on_merge=None):
+    """
+    Runs the remaining blocks of several TaxStyleRuns (see src/runner.py)
+    with simulate_tax_styles(): each block's paths are drawn once from its
+    random stream and stepped for every tax style still running, so the
+    results are those of running each tax style on its own with the serial
+    backend. Tax styles may only differ in their tax function.
+    on_merge: called after each block, e.g. to checkpoint
+    """
+    simulations = [
+        dict(run.simulation, tax_function=None) for run in runs.values()
+    ]
+    if any(simulation != simulations[0] for simulation in simulations):
+        raise ValueError("tax styles sharing a pool may only differ in their tax function")
+    if len(set((run.batch_size, run.num_iterations) for run in runs.values())) > 1:
+        raise ValueError("tax styles sharing a pool need the same batch_size and num_iterations")
+    if simulations and simulations[0].get('backend', 'serial') != 'serial':
+        raise ValueError("tax styles sharing a pool need the serial backend")
+    if simulations and simulations[0].get('adaptive'):
+        raise ValueError("adaptive traders can't share a pool between tax styles")
+
+    while True:
+        active = dict({ tax_style: run for tax_style, run in runs.items() if not run.done })
+        if len(active) == 0:
+            break
+        # styles resumed from a checkpoint can be at different blocks
+        block = min(run.next_block() for run in active.values())
+        group = dict({ tax_style: run for tax_style, run in active.items() if run.next_block() == block })
+        first = next(iter(group.values()))
+        simulation = first.simulation
+        outputs, swaps = simulate_tax_styles(
+            simulation['amm'],
+            dict({ tax_style: run.simulation['tax_function'] for tax_style, run in group.items() }),
+            simulation['lp_initial_usdc'],
+            simulation['lp_initial_dsd'],
+            simulation['mu'],
+            simulation['sigma'],
+            simulation['nobs'],
+            first.block_size(block),
+            A=simulation.get('A'),
+            absorbing=simulation.get('absorbing'),
+            rng=block_rng(seed, block),
+            slippage_surface=simulation.get('slippage_surface'),
+        )
+        for tax_style, run in group.items():
+            histories, failures, absorptions = outputs[tax_style]
+            block_result = summarise_block(histories, failures, absorptions, run.statistic, run.record)
+            write_outputs(block_result['paths'], run.outputs, block * run.batch_size, simulation['nobs'])
+            run.add(block, block_result)
+        if on_merge is not None:
+            on_merge()
@@ -0,0 +1,175 @@
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import numpy as np
+from functools import lru_cache
+
+
+CACHE_DIR = os.environ.get(
+    'DSD_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'dsd-dip14'),
+)
+
+# evict least recently used results beyond this size
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+# src modules that don't change simulation results
+NON_ENGINE_MODULES = ['cache.py', 'checkpoint.py', 'plotting.py', 'results_store.py', 'scenario.py', 'shared_arrays.py', 'sweep.py']
+
+
+
+@lru_cache(maxsize=None)
+def code_fingerprint():
+    """hash of the src engine code, so results are recomputed when it changes"""
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    sha = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(src_dir, '*.py'))):
+        if os.path.basename(path) in NON_ENGINE_MODULES:
+            continue
+        sha.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def tax_function_name(tax_function):
+    if isinstance(tax_function, str):
+        return tax_function
+    if getattr(tax_function, 'twap_window', None) is not None:
+        return "twap_tax({}, {})".format(tax_function_name(tax_function.tax_function), tax_function.twap_window)
+    return "{}.{}".format(tax_function.__module__, tax_function.__qualname__)
+
+
+def config_key(config, seed):
+    """
+    Content address of a tax style's results: hash of its config
+    (see run_configs()), the seed and the engine code fingerprint.
+    """
+    config = dict(config)
+    if 'tax_function' in config:
+        config['tax_function'] = tax_function_name(config['tax_function'])
+    payload = json.dumps(
+        dict({ 'config': config, 'seed': seed, 'code': code_fingerprint() }),
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+
+class ResultCache:
+    """
+    Results of tax style runs on local disk, one directory per content hash.
+    Per-path histories go in paths.npz, everything else in result.pkl.
+    The cache is bounded by max_bytes, evicting least recently used results.
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or CACHE_DIR
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+
+    def __repr__(self):
+        return "ResultCache(root={}, entries={}, size={:.1f}MB)".format(
+            self.root,
+            len(self.entries()),
+            self.size() / 1024**2,
+        )
+
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+
+    def get(self, key):
+        """cached results for key, or None"""
+        path = self.path(key)
+        if not os.path.exists(os.path.join(path, 'result.pkl')):
+            return None
+        with open(os.path.join(path, 'result.pkl'), 'rb') as f:
+            result = pickle.load(f)
+        with np.load(os.path.join(path, 'paths.npz')) as paths:
+            result['paths'] = dict({ metric: list(paths[metric]) for metric in paths.files })
+        # mark as recently used
+        os.utime(path)
+        return result
+
+
+    def put(self, key, result, config=None):
+        """stores results under key, written to a temporary directory then renamed"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.tmp-')
+
+        aggregate = dict(result)
+        paths = aggregate.pop('paths', dict({}))
+        # the paths are saved below; a ResultsStore may be overwritten by
+        # later runs, so cached results don't point into one
+        aggregate.pop('store', None)
+        aggregate.pop('series', None)
+        with open(os.path.join(tmp, 'result.pkl'), 'wb') as f:
+            pickle.dump(aggregate, f)
+        np.savez(
+            os.path.join(tmp, 'paths.npz'),
+            **dict({ metric: np.asarray(p, dtype=float) for metric, p in paths.items() })
+        )
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(dict({
+                'created': time.time(),
+                'config': config,
+                'code': code_fingerprint(),
+            }), f, default=str, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+        self.evict(keep=key)
+
+
+    def invalidate(self, key):
+        """removes the results stored under key"""
+        shutil.rmtree(self.path(key), ignore_errors=True)
+
+
+    def clear(self):
+        """removes every cached result"""
+        for key, size, last_used in self.entries():
+            self.invalidate(key)
+
+
+    def entries(self):
+        """list of (key, size in bytes, last used time)"""
+        entries = []
+        for path in glob.glob(os.path.join(self.root, '??', '*')):
+            key = os.path.basename(path)
+            if key.startswith('.tmp-'):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+            )
+            entries.append((key, size, os.path.getmtime(path)))
+        return entries
+
+
+    def size(self):
+        return sum(size for key, size, last_used in self.entries())
+
+
+    def evict(self, keep=None):
+        """removes least recently used results until the cache fits in max_bytes"""
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for key, size, last_used in entries)
+        for key, size, last_used in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.invalidate(key)
+            total -= size
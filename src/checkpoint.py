@@ -0,0 +1,49 @@
+
+import os
+import pickle
+import time
+
+
+# seconds between checkpoints
+DEFAULT_INTERVAL = 60
+
+
+
+class Checkpoint:
+    """
+    Periodically pickles the state of a long run (see run_configs()) to path.
+    Each checkpoint is written to a temporary file and moved into place with
+    os.replace(), so a crash while saving never leaves a broken checkpoint.
+    """
+
+    def __init__(self, path, interval=DEFAULT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last_saved = time.monotonic()
+
+
+    def __repr__(self):
+        return "Checkpoint(path={}, interval={})".format(self.path, self.interval)
+
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+
+    def save(self, state, force=False):
+        """saves state if interval seconds have passed since the last save, or if forced"""
+        if not force and time.monotonic() - self.last_saved < self.interval:
+            return False
+        tmp = "{}.tmp-{}".format(self.path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.last_saved = time.monotonic()
+        return True
+
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            return pickle.load(f)
@@ -1,10 +1,12 @@
 
+import copy
+import functools
 import numpy as np
-import pandas as pd
-# plots
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-import mplfinance as fplt
+
+# plotting libraries are imported inside the plotting functions, see src/ohlc.py
+from src.history import fork_history
+from src.twap import TwapAccumulator, tax_price
+from src.ohlc import OnlineCandles, candles, plot_candles
 
 
 # rates: uint256[N_COINS] -> uint256[N_COINS];
@@ -60,13 +62,16 @@ def get_D(xp, A=85):
 
 # def get_y(i: int128, j: int128, x: uint256, _xp: uint256[N_COINS]) -> uint256:
 # https://github.com/curvefi/curve-contract/blob/295e7daaad0654a6c7a233f77e82a01fb78d85b4/contracts/pools/usdt/StableSwapUSDT.vy#L331
-def get_y(i, j, x, _xp, A=85):
+def get_y(i, j, x, _xp, A=85, D=None, y=None):
     # x in the input is converted to the same price/precision
+    # D: the pool's invariant, if already known
+    # y: starting point of the iteration, e.g. a nearby solution (default D)
     N_COINS = len(_xp)
 
     assert (i != j) and (i >= 0) and (j >= 0) and (i < N_COINS) and (j < N_COINS)
 
-    D = get_D(_xp, A)
+    if D is None:
+        D = get_D(_xp, A)
     c = D
     S_ = 0
     Ann = A * N_COINS
@@ -86,7 +91,7 @@ def get_y(i, j, x, _xp, A=85):
     c = c * D / (Ann * N_COINS)
     b = S_ + D / Ann  # - D
     y_prev = 0
-    y = D
+    y = D if y is None else y
     for _i in range(255):
         y_prev = y
         y = (y*y + c) / (2 * y + b - D)
@@ -101,6 +106,198 @@ def get_y(i, j, x, _xp, A=85):
 
 
 
+#### Batched solvers ####
+## Same iterations as get_D() and get_y(), but over arrays of pools at once.
+## Each pool stops iterating once it has converged, like the scalar versions,
+## so results match the scalar solvers exactly.
+
+def get_D_batch(xp, A=85):
+    """
+    get_D() for many pools at once.
+    xp: list of N_COINS arrays of balances, one element per pool
+    A: amplification parameter, a scalar or one per pool
+    """
+    xp = [np.asarray(_x, dtype=float) for _x in xp]
+    N_COINS = len(xp)
+    S = np.zeros(np.broadcast(*xp).shape)
+    for _x in xp:
+        S = S + _x
+    xp = [np.broadcast_to(_x, S.shape) for _x in xp]
+    Ann = np.broadcast_to(np.multiply(A, N_COINS), S.shape)
+
+    D = S.copy()
+    # pools still iterating
+    idx = np.flatnonzero(S != 0)
+    D[S == 0] = 0
+
+    for _i in range(255):
+        if len(idx) == 0:
+            break
+        D_idx = D.flat[idx]
+        D_P = D_idx
+        for _x in xp:
+            D_P = D_P * D_idx / (_x.flat[idx] * N_COINS + 1)  # +1 is to prevent /0
+        Dprev = D_idx
+        D_idx = (Ann.flat[idx] * S.flat[idx] + D_P * N_COINS) * D_idx / (
+            (Ann.flat[idx] - 1) * D_idx + (N_COINS + 1) * D_P
+        )
+        D.flat[idx] = D_idx
+        idx = idx[np.abs(D_idx - Dprev) > PRECISION2]
+    return D
+
+
+
+def get_y_batch(i, j, x, _xp, A=85, D=None):
+    """
+    get_y() for many pools at once.
+    x: new balances of coin i, one per pool
+    _xp: list of N_COINS arrays of balances, one element per pool
+    D: the pools' invariants, if already known
+    """
+    N_COINS = len(_xp)
+
+    assert (i != j) and (i >= 0) and (j >= 0) and (i < N_COINS) and (j < N_COINS)
+
+    if D is None:
+        D = get_D_batch(_xp, A)
+    D = np.asarray(D, dtype=float)
+    c = D
+    S_ = 0
+    Ann = np.multiply(A, N_COINS)
+
+    _x = 0
+    for _i in range(N_COINS):
+        if _i == i:
+            _x = np.asarray(x, dtype=float)
+        elif _i != j:
+            _x = np.asarray(_xp[_i], dtype=float)
+        else:
+            continue
+        S_ = S_ + _x
+        c = c * D / (_x * N_COINS)
+
+    c = c * D / (Ann * N_COINS)
+    b = S_ + D / Ann  # - D
+
+    shape = np.broadcast(c, b, D).shape
+    c = np.broadcast_to(c, shape)
+    b = np.broadcast_to(b, shape)
+    D = np.broadcast_to(D, shape)
+    y = np.array(D, dtype=float)
+    # pools still iterating
+    idx = np.arange(y.size)
+
+    for _i in range(255):
+        if len(idx) == 0:
+            break
+        y_prev = y.flat[idx]
+        y_idx = (y_prev*y_prev + c.flat[idx]) / (2 * y_prev + b.flat[idx] - D.flat[idx])
+        y.flat[idx] = y_idx
+        idx = idx[np.abs(y_idx - y_prev) > PRECISION2]
+    return y
+
+
+
+#### Curve tracing ####
+## Whole Stableswap curves (x, y, price, D) for the whitepaper figures,
+## for a grid of x and one or more values of A in one call.
+
+# relative change in y at which tracing stops iterating
+TRACE_TOLERANCE = 1e-12
+# points solved from scratch before the rest of the grid is warm-started
+TRACE_COARSE_POINTS = 64
+
+
+def stableswap_price(x, y, D, A=85):
+    """
+    marginal price |dy/dx| on the 2-coin Stableswap curve through (x, y)
+    with invariant D, from the implicit derivative of the invariant get_y() solves:
+    Ann * (x + y) + D * (1 - Ann) - D**3 / (4 * x * y) = 0
+    """
+    Ann = np.multiply(A, 2)
+    D3 = np.power(D, 3) / 4
+    return (Ann + D3 / (x * x * y)) / (Ann + D3 / (x * y * y))
+
+
+def _solve_y(x, c_factor, b_extra, y, tolerance):
+    """
+    get_y()'s Newton iteration for 2 coins, from initial guesses y,
+    iterating each point until y changes by less than tolerance * y
+    """
+    # y**2 + (b - D) * y = c, with b = x + D / Ann and c = D**3 / (4 * Ann * x)
+    c = c_factor / x
+    b_D = x + b_extra
+    y = np.array(y, dtype=float)
+    # points still iterating
+    idx = np.arange(y.size)
+    for _i in range(255):
+        if len(idx) == 0:
+            break
+        y_prev = y.flat[idx]
+        y_idx = (y_prev*y_prev + c.flat[idx]) / (2 * y_prev + b_D.flat[idx])
+        y.flat[idx] = y_idx
+        idx = idx[np.abs(y_idx - y_prev) > tolerance * y_idx]
+    return y
+
+
+def trace_stableswap(x, xp=[50,50], A=85, tolerance=TRACE_TOLERANCE, coarse_points=TRACE_COARSE_POINTS):
+    """
+    The Stableswap curve through the balances xp, at every balance in x:
+    stableswap_y() for a whole grid, and for a family of A values at once.
+
+    D is solved once per A, then y at every point. TRACE_COARSE_POINTS
+    points spread over the grid are solved starting from y = D like get_y();
+    every other point starts from the line between its two solved
+    neighbours. The curve is convex, so that start is just above it and
+    Newton's iteration converges in a few steps.
+
+    x: increasing balances of coin 0, shape (points,)
+    A: a scalar, or an array of values giving one curve each
+    Returns dict of 'x', 'y', 'price' (marginal |dy/dx|, see stableswap_price())
+    and 'D', each of shape A.shape + (points,)
+    """
+    x = np.asarray(x, dtype=float)
+    A = np.asarray(A, dtype=float)
+    Ann = (A * 2)[..., None]
+    # one pool per value of A
+    pools = np.ones(A.size)
+    D = get_D_batch([pools * xp[0], pools * xp[1]], A.reshape(-1)).reshape(A.shape + (1,))
+    shape = A.shape + x.shape
+    xx = np.broadcast_to(x, shape)
+    c_factor = np.broadcast_to(D**3 / (4 * Ann), shape)
+    b_extra = np.broadcast_to(D / Ann - D, shape)
+
+    # solve a coarse subset of the grid from scratch
+    coarse = np.unique(np.linspace(0, len(x) - 1, min(coarse_points, len(x))).astype(np.int64))
+    y_coarse = _solve_y(
+        xx[..., coarse],
+        c_factor[..., coarse],
+        b_extra[..., coarse],
+        np.broadcast_to(D, shape[:-1] + coarse.shape),
+        tolerance,
+    )
+
+    # warm-start the rest from the solved neighbours on either side
+    right = np.clip(np.searchsorted(x[coarse], x), 1, max(len(coarse) - 1, 1))
+    left = right - 1
+    if len(coarse) > 1:
+        weight = (x - x[coarse[left]]) / (x[coarse[right]] - x[coarse[left]])
+        guess = y_coarse[..., left] * (1 - weight) + y_coarse[..., right] * weight
+    else:
+        guess = np.broadcast_to(y_coarse, shape)
+    y = _solve_y(xx, c_factor, b_extra, guess, tolerance)
+
+    assert not np.any(np.isnan(y)), "trace_stableswap: balance is nan"
+    assert np.all(y >= 0), "trace_stableswap: negative balance"
+    return dict({
+        'x': np.array(xx),
+        'y': y,
+        'price': stableswap_price(xx, y, D, A[..., None]),
+        'D': np.array(np.broadcast_to(D, shape)),
+    })
+
+
+
 # Buggy for now, needs investigation + help from Curve
 def _xp(balances: list[float], rates: list[float]):
     # N_COINS = len(balances)
@@ -124,13 +321,32 @@ def _xp(balances: list[float], rates: list[float]):
 class Curve:
     "The Curve Stableswap AMM"
 
+    __slots__ = [
+        'balance_x',
+        'balance_y',
+        'x_name',
+        'y_name',
+        'A',
+        'history',
+        'ohlc',
+        'live_candles',
+        'treasury_tax_rate',
+        'failure',
+        'slippage_surface',
+        'twap',
+        '_invariant',
+    ]
+    # what snapshot() keeps, besides how long the history series are
+    state_names = ['balance_x', 'balance_y', 'failure', '_invariant']
+
     def __init__(self,
         x=1200,
         y=400,
         x_name="USDC",
         y_name="DSD",
         treasury_tax_rate=0.5,
-        A=100
+        A=100,
+        history=None,
     ):
         # x, y are initial balances
         self.balance_x = x
@@ -139,16 +355,33 @@ class Curve:
         self.y_name = y_name
         self.A = A # amplification parameter
 
-        self.history = dict({
-            # history of treasury balances over time
-            'treasury_balances': [0],
-            # history of prices
-            'prices': [self.price_oracle()], # initial price
-            # history of burns over time
-            'burns': [0],
-        })
+        # lists, or e.g. spilled_history() for very long runs
+        if history is None:
+            history = dict({
+                # history of treasury balances over time
+                'treasury_balances': [],
+                # history of prices
+                'prices': [],
+                # history of burns over time
+                'burns': [],
+            })
+        self.history = history
+        self.history['treasury_balances'].append(0)
+        # initial price, solved once for all pools starting from the same balances
+        self.history['prices'].append(initial_price(x, y, A))
+        self.history['burns'].append(0)
         self.ohlc = None
+        # OnlineCandles, see track_candles()
+        self.live_candles = None
         self.treasury_tax_rate=0.5
+        # set by swap() when a trade fails: dict({ 'step', 'reason' })
+        self.failure = None
+        # SlippageSurface to look the slippage tax up in, see src/slippage_surface.py
+        self.slippage_surface = None
+        # TwapAccumulator, see track_twap()
+        self.twap = None
+        # ((balance_x, balance_y, A), D), see invariant()
+        self._invariant = None
 
 
     def __repr__(self):
@@ -171,35 +404,44 @@ class Curve:
         )
 
 
-    # def ohlc_generate_prices(self, num_sections=10):
-    #     # split history['prices'] into arrays [[], []]
-    #     ts_prices = np.array_split(self.history['prices'], num_sections)
-    #     dates = pd.date_range(start='1/1/2021', periods=len(ts_prices))
-    #     ohlc_timeseries = []
-    #
-    #     for i, ts in enumerate(ts_prices):
-    #         ohlc_timeseries.append(dict({
-    #             'Date': dates[i],
-    #             'Open': ts[0],
-    #             'High': np.max(ts),
-    #             'Low': np.min(ts),
-    #             'Close': ts[-1],
-    #         }))
-    #     # dates = pd.date_range(start='1/1/2021', end='1/2/2021', periods=1000)
-    #     ohlc_df = pd.DataFrame(ohlc_timeseries)
-    #     self.ohlc = ohlc_df.set_index("Date")
-    #     return self.ohlc
-    #
-    #
-    # def ohlc_plot(self, num_sections=10):
-    #     self.ohlc_generate_prices(num_sections)
-    #     fplt.plot(
-    #         self.ohlc,
-    #         type='candle',
-    #         style='yahoo',
-    #         title='DSD, simulated trades',
-    #         ylabel='Price DSD/USDC'
-    #     )
+    def ohlc_generate_prices(self, num_sections=10):
+        """
+        num_sections open/high/low/close candles of history['prices'],
+        or the candles built while trading if track_candles() was called
+        and num_sections is None. See src/ohlc.py
+        """
+        if num_sections is None and self.live_candles is not None:
+            self.ohlc = self.live_candles.candles()
+        else:
+            self.ohlc = candles(self.history['prices'], num_sections)
+        return self.ohlc
+
+
+    def ohlc_plot(self, num_sections=10):
+        self.ohlc_generate_prices(num_sections)
+        return plot_candles(
+            self.ohlc,
+            title='DSD, simulated trades',
+            ylabel='Price DSD/USDC',
+        )
+
+
+    def track_candles(self, bucket_size):
+        """builds candles of bucket_size prices while trading, see OnlineCandles"""
+        self.live_candles = OnlineCandles(bucket_size)
+        # starting from the current price
+        self.live_candles.update(self.history['prices'][-1])
+        return self.live_candles
+
+
+    def track_twap(self, clock=None):
+        """
+        keeps a cumulative price while the pool trades, for TWAP queries and
+        TWAP taxes (see twap_tax()). By default time is the pool's step count,
+        clock: a callable returning the current time, e.g. lambda: scheduler.now
+        """
+        self.twap = TwapAccumulator(self.history['prices'][-1], clock)
+        return self.twap
 
 
     def price_oracle(self):
@@ -218,40 +460,212 @@ class Curve:
     #     token_supply = self.balance_x + self.balance_y
     #     return D * PRECISION / token_supply
 
-    def get_virtual_price(self):
+    def get_virtual_price(self, D=None, guess=None):
         """
         Returns virtual price (for calculating profit)
         Uses the derivative method to find price
+        D: the invariant, if already known, guess: a starting point for new_x
+        """
+        return virtual_price(self.balance_x, self.balance_y, self.A, D, guess)
+
+
+    def snapshot(self):
+        """
+        the pool's state, to restore() after trying trades out: its balances,
+        failure, candles and how long each history series is (histories are
+        only appended to, so restore() truncates them)
+        """
+        return (
+            tuple(getattr(self, name) for name in self.state_names),
+            dict({ metric: len(series) for metric, series in self.history.items() }),
+            None if self.live_candles is None else self.live_candles.snapshot(),
+            None if self.twap is None else self.twap.snapshot(),
+        )
+
+
+    def restore(self, snapshot):
+        """goes back to the state of snapshot(), taken from this pool"""
+        state, lengths, candles, twap = snapshot
+        for name, value in zip(self.state_names, state):
+            setattr(self, name, value)
+        for metric, length in lengths.items():
+            del self.history[metric][length:]
+        if candles is not None:
+            self.live_candles.restore(candles)
+        if twap is not None:
+            self.twap.restore(twap)
+
+
+    def fork(self):
         """
-        # pretend we are selling 1 y and calculate
-        # derivative which will give us the price
-        y2 = self.balance_y + 10
-        y1 = self.balance_y
+        a copy of the pool to try trades out on, or to build many pools from
+        one template. Its history shares every value so far with this pool's,
+        copy-on-write (see fork_history()), so forking a pool costs the same
+        however long it has traded
+        """
+        pool = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(pool, name, getattr(self, name))
+        pool.history = fork_history(self.history)
+        pool.live_candles = copy.deepcopy(self.live_candles)
+        pool.twap = None if self.twap is None else self.twap.fork()
+        pool.ohlc = None
+        return pool
+
+
+    def invariant(self):
+        """the D invariant of the current balances, solved once until they change"""
+        key = (self.balance_x, self.balance_y, self.A)
+        if self._invariant is None or self._invariant[0] != key:
+            xp = _xp([ self.balance_x, self.balance_y ], RATES)
+            self._invariant = (key, get_D(xp, self.A))
+        return self._invariant[1]
+
+
+    def quote_sell(self, amounts):
+        """
+        What selling each of amounts DSD into the pool would do, without
+        trading: the pool and its history are left alone. Untaxed, like
+        sell_dsd() with no tax_function, with the same results.
+        One batched solve from the cached invariant, see invariant().
+        Returns dict of arrays, one element per amount:
+        'amount_out' USDC received, 'balance_x'/'balance_y' after the trade,
+        'price' price_oracle() after the trade and 'slippage' USDC received
+        per DSD sold, as sell_dsd_slippage_tax() measures it.
+        Trades the pool can't take are nan.
+        """
+        dsd = np.abs(np.asarray(amounts, dtype=float))
+        after_balance_y = self.balance_y + dsd
+        xp = _xp([ self.balance_x, self.balance_y ], RATES)
+        with np.errstate(all='ignore'):
+            after_balance_x = get_y_batch(1, 0, after_balance_y, xp, self.A, D=self.invariant())
+        return self.quote(after_balance_x, after_balance_y)
 
-        xp = _xp([ self.balance_y, self.balance_x ], RATES)
-        new_x = stableswap_x(y2, xp, self.A)
-        x2 = new_x
-        x1 = self.balance_x
 
-        return -dxdy_once( y2, y1, x2, x1 )
+    def quote_buy(self, amounts):
+        """
+        What buying each of amounts DSD from the pool would do, without
+        trading, like buy_dsd(). Returns the dict of quote_sell(), with
+        'amount_in': USDC paid, in place of 'amount_out'
+        """
+        dsd = np.abs(np.asarray(amounts, dtype=float))
+        after_balance_y = np.where(self.balance_y - dsd > 0, self.balance_y - dsd, np.nan)
+        xp = _xp([ self.balance_x, self.balance_y ], RATES)
+        with np.errstate(all='ignore'):
+            after_balance_x = get_y_batch(1, 0, after_balance_y, xp, self.A, D=self.invariant())
+        quote = self.quote(after_balance_x, after_balance_y)
+        quote['amount_in'] = -quote.pop('amount_out')
+        return quote
+
+
+    def quote(self, after_balance_x, after_balance_y):
+        """quote_sell()/quote_buy() results for the balances after each trade"""
+        after_balance_x = np.where(after_balance_x >= 0, after_balance_x, np.nan)
+        with np.errstate(all='ignore'):
+            # a swap keeps D, so the prices after share the pool's
+            price = virtual_price_batch(after_balance_x, after_balance_y, self.A, D=self.invariant())
+            slippage = np.abs(
+                (self.balance_x - after_balance_x) / (self.balance_y - after_balance_y)
+            )
+        no_trade = after_balance_y == self.balance_y
+        if np.any(no_trade):
+            # the slippage of a vanishing trade is the price
+            slippage = np.where(no_trade, self.price_oracle(), slippage)
+        return dict({
+            'amount_out': self.balance_x - after_balance_x,
+            'balance_x': after_balance_x,
+            'balance_y': after_balance_y,
+            'price': price,
+            'slippage': slippage,
+        })
 
 
     def swap(self, trade, tax_function):
         """
         trade: dict({ 'type': 'sell'|'buy', amount: float })
-        """
 
-        if trade['type'] == 'buy':
-            price_after = self.buy_dsd(trade['amount'])
-        else:
-            if tax_function == "slippage":
-                price_after = self.sell_dsd_slippage_tax(trade['amount'])
+        If a trade breaks the pool (e.g. drains one side), the path is
+        flagged in self.failure and its state is frozen: this and all
+        later swaps leave the balances alone and repeat the last values.
+        """
+        if self.failure is not None:
+            return self.carry_forward()
+
+        prior_balances = (self.balance_x, self.balance_y)
+        num_steps = len(self.history['prices'])
+        observed = None if self.twap is None else self.twap.snapshot()
+        try:
+            if trade['type'] == 'buy':
+                price_after = self.buy_dsd(trade['amount'])
             else:
-                price_after = self.sell_dsd(trade['amount'], tax_function)
-
+                if tax_function == "slippage":
+                    price_after = self.sell_dsd_slippage_tax(trade['amount'])
+                else:
+                    price_after = self.sell_dsd(trade['amount'], tax_function)
+        except (AssertionError, ZeroDivisionError) as e:
+            # undo the failed trade, then freeze the path
+            self.balance_x, self.balance_y = prior_balances
+            for series in self.history.values():
+                del series[num_steps:]
+            if self.twap is not None:
+                self.twap.restore(observed)
+            self.failure = dict({
+                'step': num_steps - 1, # index of the failed trade
+                'reason': str(e) or type(e).__name__,
+            })
+            return self.carry_forward()
+
+        if self.live_candles is not None:
+            self.live_candles.update(price_after)
         return price_after
 
 
+    def trade_net(self, dsd_amount, burn=0):
+        """
+        Moves dsd_amount DSD into the pool (out of it if negative) in one
+        trade, e.g. a block's sales net of its buys and burns, and records
+        burn DSD burnt by taxes on the way, see src/blocks.py
+        """
+        after_balance_y = self.balance_y + dsd_amount
+        assert after_balance_y > 0, "trade_net: not enough DSD in the pool"
+        after_balance_x = stableswap_x(
+            after_balance_y,
+            _xp([ self.balance_x, self.balance_y ], RATES),
+            self.A,
+            self.invariant(),
+        )
+        self.balance_y = after_balance_y
+        self.balance_x = after_balance_x
+        after_price = self.price_oracle()
+
+        # fraction of burnt dsd, to treasury, say 50%
+        burn_to_treasury = self.treasury_tax_rate * burn
+        actual_burn = (1 - self.treasury_tax_rate) * burn
+
+        self.history['treasury_balances'].append(
+            self.history['treasury_balances'][-1] + burn_to_treasury
+        )
+        self.history['prices'].append(after_price)
+        self.history['burns'].append(actual_burn)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
+        return after_price
+
+
+    def carry_forward(self):
+        """records a step where nothing happens, e.g. on a frozen path"""
+        self.history['treasury_balances'].append(
+            self.history['treasury_balances'][-1]
+        )
+        self.history['prices'].append(self.history['prices'][-1])
+        self.history['burns'].append(0)
+        if self.live_candles is not None:
+            self.live_candles.update(self.history['prices'][-1])
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
+        return self.history['prices'][-1]
+
+
     def buy_dsd_with_usdc(self, usdc_amount):
         """Buys usdc_amount worth of DSD
         no taxes for buys"""
@@ -276,6 +690,8 @@ class Curve:
         ) # no change to treasury on buys
         self.history['prices'].append(after_price)
         self.history['burns'].append(0)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
         return after_price
 
 
@@ -287,6 +703,7 @@ class Curve:
 
         # take DSD from the pool when buying DSD
         new_y = self.balance_y - dsd_amount
+        assert new_y > 0, "buy_dsd: not enough DSD in the pool"
 
         # asset x is the corresponding amount of USDC
         new_x = stableswap_x(
@@ -309,6 +726,8 @@ class Curve:
         ) # no change to treasury on buys
         self.history['prices'].append(after_price)
         self.history['burns'].append(0)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
         return after_price
 
 
@@ -320,17 +739,19 @@ class Curve:
 
         prior_balance_x = self.balance_x
         prior_balance_y = self.balance_y
-        prior_price = self.price_oracle()
+        # spot price, or the TWAP for TWAP taxes, see src/twap.py
+        prior_price = tax_price(self, tax_function)
 
         # Calculate DSD burn before updating balances
         burn = tax_function(
             price=prior_price,
-            dsd_amount=dsd_amount
+            dsd_amount=np.abs(dsd_amount)
         )
         # print("burn:", burn)
 
         # actual amount sold into LP pool after burn
         leftover_dsd = np.abs(dsd_amount) - burn
+        assert leftover_dsd >= 0, "tax exceeds amount sold"
 
         after_balance_y = self.balance_y + leftover_dsd
 
@@ -360,6 +781,8 @@ class Curve:
         )
         self.history['prices'].append(after_price)
         self.history['burns'].append(actual_burn)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
 
         return after_price
 
@@ -371,48 +794,61 @@ class Curve:
         """
         # this needs its own function as you need to calculate slipage first, before calculating burn and updating pool balances
         # unlike the other simpe price-based sales taxes
+        # both sales share the pool's invariant D, and the later solves
+        # start next to their solution, so each takes a step or two
         dsd = np.abs(dsd_amount)
         prior_balance_x = self.balance_x
         prior_balance_y = self.balance_y
-        prior_price = self.price_oracle()
+        prior_price = self.history['prices'][-1]
+        D = self.invariant()
 
         xp = _xp([ self.balance_x, self.balance_y ], RATES)
-        # balance_y (DSD) increases when DSD is sold to pool
-        _after_balance_x = stableswap_x(
-            prior_balance_y + dsd,
-            xp,
-            self.A,
-        )
-        _after_balance_y = self.balance_y + dsd
-
-        # calculate slippage + burn first, before swap
-        slippage = dxdy_once(
-            y2 = _after_balance_y,
-            y1 = prior_balance_y,
-            x2 = _after_balance_x,
-            x1 = prior_balance_x,
-        )
+        slippage = None
+        if self.slippage_surface is not None:
+            slippage = self.slippage_surface.lookup(dsd, prior_balance_x, prior_balance_y)
+
+        if slippage is None:
+            # balance_y (DSD) increases when DSD is sold to pool
+            _after_balance_x = stableswap_x(
+                prior_balance_y + dsd,
+                xp,
+                self.A,
+                D,
+            )
+            _after_balance_y = prior_balance_y + dsd
+
+            # calculate slippage + burn first, before swap
+            slippage = dxdy_once(
+                y2 = _after_balance_y,
+                y1 = prior_balance_y,
+                x2 = _after_balance_x,
+                x1 = prior_balance_x,
+            )
         burn =  (1 - np.abs(slippage)) * dsd if (np.abs(slippage) < 1) else 0
-        # print("burn: {}".format(1 - slippage))
-        # print("price: {}".format(prior_price))
-        # print("slippage: {}".format(slippage))
-        # print("burn: {}".format(burn))
 
         # actual amount sold into LP pool after burn
         leftover_dsd = dsd - burn
 
-        # now update calculate burn-adjusted balance for x
+        # now update calculate burn-adjusted balance for x, starting from the
+        # line to the untaxed sale, which lies just above the convex curve
         after_balance_x = stableswap_x(
             prior_balance_y + leftover_dsd,
             xp,
             self.A,
+            D,
+            prior_balance_x - np.abs(slippage) * leftover_dsd,
         )
-        after_balance_y = prior_balance_x + leftover_dsd
+        after_balance_y = prior_balance_y + leftover_dsd
 
         # now update balances adjusting for burn
         self.balance_y = after_balance_y
         self.balance_x = after_balance_x
-        after_price = self.price_oracle()
+        # the new balances' D prices them, and is the next sale's D
+        # selling 10 more DSD moves x by about 10 times the price
+        after_price = self.get_virtual_price(
+            self.invariant(),
+            after_balance_x - 10 * prior_price,
+        )
 
 
         # fraction of sales taxes paid to treasury
@@ -424,6 +860,8 @@ class Curve:
         )
         self.history['prices'].append(after_price)
         self.history['burns'].append(actual_burn)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
 
         return after_price
 
@@ -443,21 +881,62 @@ def stableswap_y(x, xp=[50,50], A=85):
     j = 1 # position 1 for second coin
     amp = A
     y = get_y(i, j, x, xp, amp)
-    assert not np.isnan(y)
-    assert y >= 0
+    assert not np.isnan(y), "stableswap_y: balance is nan"
+    assert y >= 0, "stableswap_y: negative balance"
     return y
 
-def stableswap_x(y, xp=[50,50], A=85):
+def stableswap_x(y, xp=[50,50], A=85, D=None, guess=None):
     i = 0 # position 0 for first coin
     j = 1 # position 1 for second coin
     amp = A
+    if guess is not None and guess <= 0:
+        # Newton's method from there can land on the negative root, start from D
+        guess = None
     # swap coins i and j around
-    x = get_y(j, i, y, xp, amp)
-    assert not np.isnan(x)
-    assert x >= 0
+    x = get_y(j, i, y, xp, amp, D, guess)
+    assert not np.isnan(x), "stableswap_x: balance is nan"
+    assert x >= 0, "stableswap_x: negative balance"
     return x
 
 
+def virtual_price(balance_x, balance_y, A=85, D=None, guess=None):
+    """
+    Curve.get_virtual_price() of a pool with balances (balance_x, balance_y)
+    D: the invariant, if already known, guess: a starting point for new_x
+    """
+    # pretend we are selling 1 y and calculate
+    # derivative which will give us the price
+    y2 = balance_y + 10
+    y1 = balance_y
+
+    xp = _xp([ balance_y, balance_x ], RATES)
+    new_x = stableswap_x(y2, xp, A, D, guess)
+    x2 = new_x
+    x1 = balance_x
+
+    return -dxdy_once( y2, y1, x2, x1 )
+
+
+@functools.lru_cache(maxsize=1024)
+def initial_price(balance_x, balance_y, A):
+    """virtual_price() of a fresh pool, shared by every pool built with the same settings"""
+    return virtual_price(balance_x, balance_y, A)
+
+
+def virtual_price_batch(balance_x, balance_y, A=85, D=None):
+    """
+    Curve.get_virtual_price() for arrays of balances
+    D: the pools' invariants, if already known, e.g. the pool's own after a swap
+    """
+    # pretend we are selling 10 y and calculate
+    # derivative which will give us the price
+    y2 = balance_y + 10
+    y1 = balance_y
+    x2 = get_y_batch(1, 0, y2, [balance_y, balance_x], A, D)
+    x1 = balance_x
+    return -((x1 - x2) / (y1 - y2))
+
+
 def dydx_once(y2, y1, x2, x1):
     """calculates derivative for dy relative to dx"""
     # # Needed to figure out dUSDC/dDSD slippage/price impact
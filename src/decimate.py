@@ -0,0 +1,71 @@
+
+import numpy as np
+
+
+
+def minmax_decimate(x, lines, num_buckets):
+    """
+    Keeps the lowest and highest point of each of num_buckets buckets of
+    every line, in the order they occur, so spikes survive at any zoom.
+    x: (steps,), lines: (paths, steps)
+    Returns (xs, ys), both (paths, 2 * num_buckets)
+    """
+    lines = np.atleast_2d(np.asarray(lines, dtype=float))
+    num_paths, num_steps = lines.shape
+    bucket = -(-num_steps // num_buckets)
+    num_buckets = -(-num_steps // bucket)
+    # pad the last bucket with the last value
+    padded = np.concatenate([
+        lines,
+        np.repeat(lines[:, -1:], num_buckets * bucket - num_steps, axis=1),
+    ], axis=1).reshape(num_paths, num_buckets, bucket)
+
+    offsets = np.arange(num_buckets) * bucket
+    lowest = np.minimum(offsets + np.argmin(padded, axis=2), num_steps - 1)
+    highest = np.minimum(offsets + np.argmax(padded, axis=2), num_steps - 1)
+    index = np.stack([np.minimum(lowest, highest), np.maximum(lowest, highest)], axis=2)
+    index = index.reshape(num_paths, 2 * num_buckets)
+    return np.asarray(x)[index], np.take_along_axis(lines, index, axis=1)
+
+
+def lttb(x, lines, num_points):
+    """
+    Largest-Triangle-Three-Buckets downsampling of every line to num_points
+    points: keeps the first and last points, and from each bucket in between
+    the point forming the largest triangle with the point kept before it and
+    the average of the next bucket. Vectorised over paths.
+    x: (steps,), lines: (paths, steps)
+    Returns (xs, ys), both (paths, num_points)
+    """
+    x = np.asarray(x, dtype=float)
+    lines = np.atleast_2d(np.asarray(lines, dtype=float))
+    num_paths, num_steps = lines.shape
+    if num_points >= num_steps or num_points < 3:
+        return np.broadcast_to(x, lines.shape), lines
+
+    paths = np.arange(num_paths)
+    every = (num_steps - 2) / (num_points - 2)
+    index = np.zeros((num_paths, num_points), dtype=np.int64)
+    index[:, -1] = num_steps - 1
+    kept = np.zeros(num_paths, dtype=np.int64)
+
+    for i in range(num_points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, num_steps)
+        if next_start >= next_end:
+            next_start, next_end = num_steps - 1, num_steps
+
+        average_x = x[next_start:next_end].mean()
+        average_y = lines[:, next_start:next_end].mean(axis=1)
+        kept_x = x[kept][:, None]
+        kept_y = lines[paths, kept][:, None]
+        area = np.abs(
+            (kept_x - average_x) * (lines[:, start:end] - kept_y)
+            - (kept_x - x[start:end]) * (average_y[:, None] - kept_y)
+        )
+        kept = start + np.argmax(area, axis=1)
+        index[:, i + 1] = kept
+
+    return x[index], np.take_along_axis(lines, index, axis=1)
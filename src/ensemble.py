@@ -0,0 +1,301 @@
+
+import numpy as np
+
+from src.curve_amm import get_y_batch, virtual_price_batch
+
+
+# metrics recorded in each path's history, same as the pools' history
+METRICS = ['prices', 'burns', 'treasury_balances']
+
+
+
+def apply_tax(tax_function, prices, dsd_amounts):
+    """
+    Evaluates a tax function over arrays of paths.
+    Tax functions written for scalars (or that trip an assert on one path)
+    are evaluated path by path, so only the offending paths fail.
+    Returns (burns, failed, reasons)
+    """
+    failed = np.zeros(len(prices), dtype=bool)
+    reasons = np.full(len(prices), None, dtype=object)
+    try:
+        with np.errstate(all='ignore'):
+            burns = tax_function(price=prices, dsd_amount=dsd_amounts)
+        burns = np.broadcast_to(np.asarray(burns, dtype=float), prices.shape).copy()
+        return burns, failed, reasons
+    except (AssertionError, ValueError, ZeroDivisionError):
+        pass
+
+    burns = np.zeros(len(prices))
+    for n, (price, dsd_amount) in enumerate(zip(prices, dsd_amounts)):
+        try:
+            burns[n] = tax_function(price=price, dsd_amount=dsd_amount)
+        except (AssertionError, ZeroDivisionError) as e:
+            failed[n] = True
+            reasons[n] = str(e) or type(e).__name__
+    return burns, failed, reasons
+
+
+
+# absorbing conditions: name -> (state variable, comparison with the threshold)
+ABSORBING_CONDITIONS = dict({
+    # price pinned near 0
+    'price_below': ('price', np.less_equal),
+    'price_above': ('price', np.greater_equal),
+    # pool drained down to a floor
+    'balance_x_below': ('balance_x', np.less_equal),
+    'balance_y_below': ('balance_y', np.less_equal),
+    # treasury target reached
+    'treasury_above': ('treasury', np.greater_equal),
+})
+
+
+def absorbed(absorbing, state):
+    """
+    Checks which paths have reached an absorbing state.
+    absorbing: dict of condition -> threshold, e.g. dict({ 'price_below': 0.01 })
+    state: dict with 'price', 'balance_x', 'balance_y', 'treasury'
+        (scalars for one pool, or arrays for a batch)
+    Returns (mask, reasons), reasons being the first condition met
+    """
+    mask = np.zeros(np.shape(state['price']), dtype=bool)
+    reasons = np.full(np.shape(state['price']), None, dtype=object)
+    for condition, threshold in (absorbing or dict({})).items():
+        if condition not in ABSORBING_CONDITIONS:
+            raise ValueError("unknown absorbing condition: {}".format(condition))
+        variable, compare = ABSORBING_CONDITIONS[condition]
+        mask = flag(mask, reasons, compare(state[variable], threshold), condition)
+    return mask, reasons
+
+
+
+def flag(failed, reasons, mask, reason):
+    """flags the paths in mask, keeping the first reason for each path"""
+    new = mask & ~failed
+    reasons[new] = reason
+    failed |= mask
+    return failed
+
+
+
+class Ensemble:
+    """
+    A batch of independent pools stepped together with NumPy,
+    one column of trades (one per path) at a time.
+
+    Paths that fail (e.g. a trade drains the pool) are frozen: their
+    failure step and reason are recorded and they are dropped from the
+    state arrays, so the per-step arithmetic only runs over live paths.
+
+    Paths that reach an absorbing state (see ABSORBING_CONDITIONS) are
+    dropped the same way, so per-step work shrinks as paths finish.
+    Stopped paths have their last values carried forward in the histories.
+    """
+
+    # per-path state arrays, compacted together when paths stop
+    state_names = ['balance_x', 'balance_y', 'treasury', 'price']
+
+    def __init__(self,
+        num_paths,
+        x=1200,
+        y=400,
+        treasury_tax_rate=0.5,
+        absorbing=None,
+    ):
+        self.num_paths = num_paths
+        # dict of absorbing condition -> threshold
+        self.absorbing = absorbing
+        self.balance_x = np.full(num_paths, x, dtype=float)
+        self.balance_y = np.full(num_paths, y, dtype=float)
+        self.treasury = np.zeros(num_paths)
+        self.treasury_tax_rate = treasury_tax_rate
+
+        # path ids of the paths still being stepped
+        self.active = np.arange(num_paths)
+        # step of the failed trade on each path, -1 if it never failed
+        self.failed_step = np.full(num_paths, -1)
+        self.failure_reason = np.full(num_paths, None, dtype=object)
+        # step of the trade that led to an absorbing state, -1 if none did
+        self.absorbed_step = np.full(num_paths, -1)
+        self.absorbed_reason = np.full(num_paths, None, dtype=object)
+        # last recorded step of each path that stopped early, -1 if it didn't
+        self.stop_step = np.full(num_paths, -1)
+
+
+    def __repr__(self):
+        return "{name}(num_paths={num_paths}, active={active}, failed={failed}, absorbed={absorbed})".format(
+            name = type(self).__name__,
+            num_paths = self.num_paths,
+            active = len(self.active),
+            failed = np.sum(self.failed_step >= 0),
+            absorbed = np.sum(self.absorbed_step >= 0),
+        )
+
+
+    def compact(self, keep):
+        """drops the paths not in keep from the state arrays"""
+        for name in self.state_names:
+            setattr(self, name, getattr(self, name)[keep])
+        self.active = self.active[keep]
+
+
+    def run(self, trades, tax_function):
+        """
+        trades: (num_paths, nobs) signed trade amounts, buys > 0 and sells < 0,
+            as generated by generate_trade()
+        Returns dict of (num_paths, nobs+1) histories for each metric.
+        """
+        trades = np.asarray(trades, dtype=float)
+        nobs = trades.shape[1]
+        history = dict({
+            metric: np.zeros((self.num_paths, nobs + 1)) for metric in METRICS
+        })
+        history['prices'][self.active, 0] = self.price
+        history['treasury_balances'][self.active, 0] = self.treasury
+
+        for t in range(nobs):
+            if len(self.active) == 0:
+                break
+            paths = self.active
+            burns, failed, reasons = self.step(trades[paths, t], tax_function)
+
+            # failed paths keep their old state, so this carries them forward
+            history['prices'][paths, t+1] = self.price
+            history['treasury_balances'][paths, t+1] = self.treasury
+            history['burns'][paths, t+1] = burns
+
+            stopped = failed
+            if np.any(failed):
+                self.failed_step[paths[failed]] = t
+                self.failure_reason[paths[failed]] = reasons[failed]
+
+            if self.absorbing:
+                done, conditions = absorbed(self.absorbing, dict({
+                    'price': self.price,
+                    'balance_x': self.balance_x,
+                    'balance_y': self.balance_y,
+                    'treasury': self.treasury,
+                }))
+                done &= ~failed
+                self.absorbed_step[paths[done]] = t
+                self.absorbed_reason[paths[done]] = conditions[done]
+                stopped = failed | done
+
+            if np.any(stopped):
+                self.stop_step[paths[stopped]] = t+1
+                self.compact(~stopped)
+
+        self.fill_stopped(history)
+        return history
+
+
+    def fill_stopped(self, history):
+        """carries the last values of stopped paths forward to the end"""
+        for path in np.flatnonzero(self.stop_step >= 0):
+            last = self.stop_step[path]
+            for metric in ['prices', 'treasury_balances']:
+                history[metric][path, last+1:] = history[metric][path, last]
+            history['burns'][path, last+1:] = 0
+
+
+    def step(self, amounts, tax_function):
+        """
+        Applies one trade to every active path.
+        Returns (actual burns, failed, reasons) for the active paths
+        """
+        new_x, new_y, burns, failed, reasons = self.swap(amounts, tax_function)
+
+        # failed paths keep their old state
+        ok = ~failed
+        burns = np.where(ok, burns, 0)
+        self.balance_x = np.where(ok, new_x, self.balance_x)
+        self.balance_y = np.where(ok, new_y, self.balance_y)
+        self.price = np.where(ok, self.price_oracle(), self.price)
+
+        # fraction of burnt dsd, to treasury, say 50%
+        burn_to_treasury = self.treasury_tax_rate * burns
+        actual_burns = (1 - self.treasury_tax_rate) * burns
+        self.treasury = self.treasury + burn_to_treasury
+        return actual_burns, failed, reasons
+
+
+    def trade_sizes(self, amounts, tax_function):
+        """
+        DSD burnt and DSD going into (sells) or out of (buys) the pool
+        for every active path.
+        Returns (new_y, burns, failed, reasons)
+        """
+        buys = amounts >= 0
+        dsd = np.abs(amounts)
+
+        burns = np.zeros(len(amounts))
+        failed = np.zeros(len(amounts), dtype=bool)
+        reasons = np.full(len(amounts), None, dtype=object)
+
+        # no taxes for buys
+        sells = np.flatnonzero(~buys)
+        burns[sells], failed[sells], reasons[sells] = apply_tax(
+            tax_function,
+            self.price[sells],
+            dsd[sells],
+        )
+
+        # actual amount sold into LP pool after burn
+        leftover_dsd = dsd - burns
+        failed = flag(failed, reasons, leftover_dsd < 0, "tax exceeds amount sold")
+
+        new_y = np.where(buys, self.balance_y - dsd, self.balance_y + leftover_dsd)
+        failed = flag(failed, reasons, new_y <= 0, "buy_dsd: not enough DSD in the pool")
+        return new_y, burns, failed, reasons
+
+
+
+class UniswapEnsemble(Ensemble):
+    "A batch of Uniswap pools, see Uniswap"
+
+    state_names = Ensemble.state_names + ['k']
+
+    def __init__(self, num_paths, x=1200, y=400, treasury_tax_rate=0.5, absorbing=None):
+        super().__init__(num_paths, x, y, treasury_tax_rate, absorbing)
+        self.k = self.balance_x * self.balance_y # invariant
+        self.price = self.price_oracle()
+
+
+    def price_oracle(self):
+        return self.balance_x / self.balance_y
+
+
+    def swap(self, amounts, tax_function):
+        new_y, burns, failed, reasons = self.trade_sizes(amounts, tax_function)
+
+        with np.errstate(all='ignore'):
+            new_x = self.k / new_y
+        failed = flag(failed, reasons, np.isnan(new_x), "uniswap_x: balance is nan")
+        failed = flag(failed, reasons, ~(new_x >= 0), "uniswap_x: negative balance")
+        return new_x, new_y, burns, failed, reasons
+
+
+
+class CurveEnsemble(Ensemble):
+    "A batch of Curve Stableswap pools, see Curve"
+
+    def __init__(self, num_paths, x=1200, y=400, treasury_tax_rate=0.5, A=100, absorbing=None):
+        super().__init__(num_paths, x, y, treasury_tax_rate, absorbing)
+        self.A = A # amplification parameter
+        self.price = self.price_oracle()
+
+
+    def price_oracle(self):
+        """Curve.get_virtual_price() for every active path"""
+        with np.errstate(all='ignore'):
+            return virtual_price_batch(self.balance_x, self.balance_y, self.A)
+
+
+    def swap(self, amounts, tax_function):
+        new_y, burns, failed, reasons = self.trade_sizes(amounts, tax_function)
+
+        with np.errstate(all='ignore'):
+            new_x = get_y_batch(1, 0, new_y, [self.balance_x, self.balance_y], self.A)
+        failed = flag(failed, reasons, np.isnan(new_x), "stableswap_x: balance is nan")
+        failed = flag(failed, reasons, ~(new_x >= 0), "stableswap_x: negative balance")
+        return new_x, new_y, burns, failed, reasons
@@ -0,0 +1,241 @@
+
+import heapq
+import itertools
+import numpy as np
+
+from src.random import trade_from_amount
+from src.runner import create_pool
+from src.tax_functions import uses_twap
+
+
+# random numbers drawn at a time by the arrival processes and traders
+DEFAULT_CHUNK_SIZE = 4096
+
+# order of events at the same time: lower first. Grid samples see the
+# state from before anything else happening at their time.
+PRIORITIES = dict({
+    'record': -1,
+    'protocol': 0,
+    'agent': 1,
+    'trade': 2,
+})
+
+
+
+class Scheduler:
+    """
+    A simulation clock: events wait in a binary heap ordered by (time,
+    priority, order scheduled) and run in that order.
+
+    An event is any callable action(scheduler, time). If it returns a time
+    it is scheduled again then, which is how arrival processes, periodic
+    protocol events and agents waking themselves up all work, with one
+    heap entry each however many times they fire.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        # the pool the events act on, if any
+        self.pool = None
+        self.heap = []
+        self.order = itertools.count()
+        # events run so far
+        self.events = 0
+
+
+    def __repr__(self):
+        return "Scheduler(now={}, pending={}, events={})".format(self.now, len(self.heap), self.events)
+
+
+    def schedule(self, time, action, priority=PRIORITIES['agent']):
+        """runs action(scheduler, time) at time"""
+        if time < self.now:
+            raise ValueError("can't schedule an event at {}, the clock is at {}".format(time, self.now))
+        heapq.heappush(self.heap, (time, priority, next(self.order), action))
+
+
+    def every(self, period, action, start=None, priority=PRIORITIES['protocol']):
+        """runs action(scheduler, time) every period from start (by default now + period)"""
+        def periodic(scheduler, time):
+            action(scheduler, time)
+            return time + period
+        self.schedule(self.now + period if start is None else start, periodic, priority)
+
+
+    def run(self, until):
+        """runs every event up to and including time until"""
+        heap = self.heap
+        order = self.order
+        events = 0
+        while heap and heap[0][0] <= until:
+            # popped before it runs: the action may schedule events ahead of
+            # its own entry, e.g. at the same time with a lower priority
+            time, priority, _, action = heapq.heappop(heap)
+            self.now = time
+            next_time = action(self, time)
+            events += 1
+            if next_time is not None:
+                heapq.heappush(heap, (next_time, priority, next(order), action))
+        self.events += events
+        self.now = max(self.now, until)
+        return self
+
+
+
+def poisson_arrivals(rate, rng=None, start=0.0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """arrival times of a Poisson process of rate events per unit time, an endless iterator"""
+    rng = rng or np.random.default_rng()
+    time = start
+    while True:
+        times = time + np.cumsum(rng.exponential(1 / rate, chunk_size))
+        time = times[-1]
+        yield from times.tolist()
+
+
+def thinned_arrivals(intensity, max_rate, rng=None, start=0.0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    arrival times of a Poisson process with a time-varying rate, by thinning:
+    candidates arrive at max_rate and each is kept with probability
+    intensity(time) / max_rate.
+    intensity: rate at an array of times, never above max_rate
+    """
+    rng = rng or np.random.default_rng()
+    candidates = poisson_arrivals(max_rate, rng, start, chunk_size)
+    while True:
+        times = np.fromiter(itertools.islice(candidates, chunk_size), dtype=float, count=chunk_size)
+        rates = np.broadcast_to(intensity(times), times.shape)
+        assert np.all(rates <= max_rate), "thinned_arrivals: intensity exceeds max_rate"
+        yield from times[rng.uniform(0, max_rate, chunk_size) < rates].tolist()
+
+
+
+class TradeArrivals:
+    """
+    Trades arriving at a pool at the times of an arrival process, with
+    amounts drawn from N(mu, sigma) as generate_trade() draws them.
+    Schedule it with start().
+    """
+
+    def __init__(self, pool, tax_function, mu, sigma, arrivals, rng=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.pool = pool
+        self.tax_function = tax_function
+        self.mu = mu
+        self.sigma = sigma
+        self.arrivals = iter(arrivals)
+        self.rng = rng or np.random.default_rng()
+        self.chunk_size = chunk_size
+        self.amounts = iter(())
+        # trades made so far
+        self.count = 0
+
+
+    def start(self, scheduler):
+        scheduler.schedule(next(self.arrivals), self, PRIORITIES['trade'])
+        return self
+
+
+    def __call__(self, scheduler, time):
+        amount = next(self.amounts, None)
+        if amount is None:
+            self.amounts = iter(self.rng.normal(self.mu, self.sigma, self.chunk_size).tolist())
+            amount = next(self.amounts)
+        self.pool.swap(trade_from_amount(amount), tax_function=self.tax_function)
+        self.count += 1
+        return next(self.arrivals, None)
+
+
+
+class TimeGrid:
+    """
+    Records a pool on a fixed wall-clock grid, every interval from start:
+    the last price and treasury balance, and the DSD burnt since the
+    previous sample, whatever number of trades happened in between.
+    Schedule it with start().
+    """
+
+    def __init__(self, pool, interval, start=0.0):
+        self.pool = pool
+        self.interval = interval
+        self.first = start
+        self.series = dict({
+            'times': [],
+            'prices': [],
+            'treasury_balances': [],
+            'burns': [],
+        })
+        # steps of the pool's history already counted in 'burns'
+        self.recorded = len(pool.history['burns'])
+
+
+    def start(self, scheduler):
+        scheduler.schedule(self.first, self, PRIORITIES['record'])
+        return self
+
+
+    def __call__(self, scheduler, time):
+        history = self.pool.history
+        burns = history['burns']
+        num_steps = len(burns)
+        # a failed trade truncates the history back, never below a sample
+        burnt = sum(burns[step] for step in range(self.recorded, num_steps))
+        self.recorded = num_steps
+        self.series['times'].append(time)
+        self.series['prices'].append(history['prices'][-1])
+        self.series['treasury_balances'].append(history['treasury_balances'][-1])
+        self.series['burns'].append(burnt)
+        return time + self.interval
+
+
+    def arrays(self):
+        """the recorded series as arrays"""
+        return dict({ name: np.asarray(values, dtype=float) for name, values in self.series.items() })
+
+
+
+def simulate_events(
+    amm,
+    tax_function,
+    lp_initial_usdc,
+    lp_initial_dsd,
+    mu,
+    sigma,
+    rate,
+    until,
+    interval,
+    A=None,
+    intensity=None,
+    rng=None,
+    protocol_events=(),
+    agents=(),
+    history=None,
+):
+    """
+    Runs one path in continuous time: trades arrive as a Poisson process of
+    rate trades per unit time (or, with intensity, a time-varying process
+    of at most rate, see thinned_arrivals()) until time until, and the
+    pool is recorded every interval, see TimeGrid.
+    protocol_events: (period, action) pairs run every period, e.g. epochs
+    agents: (time, action) pairs, each action(scheduler, time) runs at time
+        and returns when to wake it up next, or None
+    Actions reach the pool as scheduler.pool.
+    Returns (pool, recorded series as arrays, scheduler)
+    """
+    rng = rng or np.random.default_rng()
+    pool = create_pool(amm, lp_initial_usdc, lp_initial_dsd, A, history)
+    scheduler = Scheduler()
+    scheduler.pool = pool
+    if uses_twap(tax_function):
+        # TWAP windows in time units
+        pool.track_twap(clock=lambda: scheduler.now)
+    if intensity is None:
+        arrivals = poisson_arrivals(rate, rng)
+    else:
+        arrivals = thinned_arrivals(intensity, rate, rng)
+    TradeArrivals(pool, tax_function, mu, sigma, arrivals, rng).start(scheduler)
+    grid = TimeGrid(pool, interval).start(scheduler)
+    for period, action in protocol_events:
+        scheduler.every(period, action)
+    for time, action in agents:
+        scheduler.schedule(time, action, PRIORITIES['agent'])
+    scheduler.run(until)
+    return pool, grid.arrays(), scheduler
@@ -0,0 +1,282 @@
+
+import bisect
+import itertools
+import os
+import numpy as np
+
+
+# values buffered in memory per series before they are written out
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+# series in a pool's history
+HISTORY_METRICS = ['treasury_balances', 'prices', 'burns']
+
+
+
+class SpilledSeries:
+    """
+    A list-like time series for very long runs: values are buffered in a
+    fixed-size chunk and appended to a raw binary file whenever the chunk
+    fills up, so memory stays bounded by chunk_size however long the run.
+
+    Supports what the pools do with their history lists: append(), [-1],
+    len() and truncating with del series[n:]. np.asarray(series) loads the
+    whole series, read_series() memory-maps it instead.
+    """
+
+    def __init__(self, path, chunk_size=DEFAULT_CHUNK_SIZE, dtype='float64'):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.chunk = np.empty(chunk_size, dtype=self.dtype)
+        # values in the chunk, and values already in the file
+        self.filled = 0
+        self.flushed = 0
+        # starts a new file
+        open(self.path, 'wb').close()
+
+
+    def __repr__(self):
+        return "SpilledSeries(path={}, length={})".format(self.path, len(self))
+
+
+    def __len__(self):
+        return self.flushed + self.filled
+
+
+    def append(self, value):
+        if self.filled == len(self.chunk):
+            self.flush()
+        self.chunk[self.filled] = value
+        self.filled += 1
+
+
+    def flush(self):
+        """appends the buffered values to the file"""
+        if self.filled == 0:
+            return
+        with open(self.path, 'ab') as f:
+            f.write(self.chunk[:self.filled].tobytes())
+        self.flushed += self.filled
+        self.filled = 0
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return np.asarray(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SpilledSeries index out of range")
+        if index >= self.flushed:
+            return self.chunk[index - self.flushed]
+        return self.read()[index]
+
+
+    def __delitem__(self, index):
+        """truncates the series, only del series[n:] is supported"""
+        if not isinstance(index, slice) or index.stop is not None or index.step is not None:
+            raise TypeError("SpilledSeries only supports truncation, del series[n:]")
+        start = min(index.start or 0, len(self))
+        if start >= self.flushed:
+            self.filled = start - self.flushed
+        else:
+            os.truncate(self.path, start * self.dtype.itemsize)
+            self.flushed = start
+            self.filled = 0
+
+
+    def __iter__(self):
+        if self.flushed > 0:
+            yield from self.read()
+        yield from self.chunk[:self.filled]
+
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.concatenate([self.read(), self.chunk[:self.filled]])
+        return values if dtype is None else values.astype(dtype)
+
+
+    def read(self):
+        """read-only memory map of the values written to the file so far"""
+        return read_series(self.path, self.dtype, self.flushed)
+
+
+    def freeze(self):
+        """writes out the buffered values and frees the chunk, for series nothing appends to again, see fork_history()"""
+        self.flush()
+        self.chunk = np.empty(0, dtype=self.dtype)
+
+
+    def close(self):
+        """writes out the buffered values, after which read() has the whole series"""
+        self.flush()
+        return self.read()
+
+
+
+def read_series(path, dtype='float64', length=None):
+    """memory-maps a series written by SpilledSeries"""
+    dtype = np.dtype(dtype)
+    if length is None:
+        length = os.path.getsize(path) // dtype.itemsize
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+
+def spilled_history(directory, chunk_size=DEFAULT_CHUNK_SIZE, dtype='float64'):
+    """
+    An empty pool history backed by files, for e.g. Uniswap(history=...)
+        directory/<metric>.bin
+    """
+    os.makedirs(directory, exist_ok=True)
+    return dict({
+        metric: SpilledSeries(os.path.join(directory, metric + '.bin'), chunk_size, dtype)
+        for metric in HISTORY_METRICS
+    })
+
+
+def close_history(history):
+    """flushes a spilled history, returns dict of metric -> memory-mapped series"""
+    return dict({ metric: series.close() for metric, series in history.items() })
+
+
+
+class ForkedSeries:
+    """
+    A list-like time series sharing its first values with the other forks
+    of a pool, copy-on-write, see fork_history(). The shared values are
+    frozen segments (a list or series and how many of its values are in
+    this one) that nothing writes to any more; each fork appends to its own
+    tail, so forking costs the same however long the series is. The tail is
+    a list, or for forks of a spilled history a SpilledSeries of its own,
+    so forks keep the bounded memory of spilling.
+
+    Supports what the pools do with their history lists: append(), [i],
+    len() and truncating with del series[n:], which only shortens this
+    fork's view of the shared values.
+    """
+
+    def __init__(self, segments, tail=None):
+        # frozen (values, length) pairs, shared with other forks
+        self.segments = segments
+        # index of the first value of each segment, and of the tail
+        self.offsets = [0]
+        for values, length in segments:
+            self.offsets.append(self.offsets[-1] + length)
+        self.tail = [] if tail is None else tail
+        # the tail list is never replaced, so appending is list.append()
+        self.append = self.tail.append
+
+
+    def __repr__(self):
+        return "ForkedSeries(segments={}, length={})".format(len(self.segments), len(self))
+
+
+    def __getstate__(self):
+        return dict({ 'segments': self.segments, 'tail': self.tail })
+
+
+    def __setstate__(self, state):
+        self.__init__(state['segments'], state['tail'])
+
+
+    def __len__(self):
+        return self.offsets[-1] + len(self.tail)
+
+
+    def __getitem__(self, index):
+        if index == -1 and self.tail:
+            # the pools read their last values every trade
+            return self.tail[-1]
+        if isinstance(index, slice):
+            return np.asarray(self)[index]
+        shared = self.offsets[-1]
+        if index < 0:
+            index += len(self)
+        if index >= shared:
+            return self.tail[index - shared]
+        if index < 0:
+            raise IndexError("ForkedSeries index out of range")
+        segment = bisect.bisect_right(self.offsets, index) - 1
+        return self.segments[segment][0][index - self.offsets[segment]]
+
+
+    def __delitem__(self, index):
+        """truncates the series, only del series[n:] is supported"""
+        if not isinstance(index, slice) or index.stop is not None or index.step is not None:
+            raise TypeError("ForkedSeries only supports truncation, del series[n:]")
+        start = min(index.start or 0, len(self))
+        shared = self.offsets[-1]
+        if start >= shared:
+            del self.tail[start - shared:]
+            return
+        # cut this fork's view of the shared values, they stay as they are
+        del self.tail[:]
+        segment = bisect.bisect_right(self.offsets, start) - 1
+        self.segments = self.segments[:segment + 1]
+        self.offsets = self.offsets[:segment + 2]
+        self.segments[segment] = (self.segments[segment][0], start - self.offsets[segment])
+        self.offsets[-1] = start
+
+
+    def __iter__(self):
+        for values, length in self.segments:
+            yield from itertools.islice(values, length)
+        yield from self.tail
+
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.concatenate(
+            [np.asarray(values[:length], dtype=float) for values, length in self.segments]
+            + [np.asarray(self.tail, dtype=float)]
+        )
+        return values if dtype is None else values.astype(dtype)
+
+
+    def frozen(self):
+        """segments holding this series' values, for forks sharing them"""
+        if len(self.tail) == 0:
+            return list(self.segments)
+        return self.segments + [(self.tail, len(self.tail))]
+
+
+
+def fork_tail(series):
+    """
+    an empty tail for a fork of series: a SpilledSeries next to the file of
+    a spilled series (<name>.<n>.bin), a list otherwise
+    """
+    if isinstance(series, ForkedSeries):
+        series = series.tail
+    if not isinstance(series, SpilledSeries):
+        return []
+    base, ext = os.path.splitext(series.path)
+    for n in itertools.count(1):
+        path = "{}.{}{}".format(base, n, ext)
+        if not os.path.exists(path):
+            return SpilledSeries(path, series.chunk_size, series.dtype)
+
+
+def fork_history(history):
+    """
+    Forks a pool's history: returns a history for the copy, sharing every
+    value so far, and replaces the series of history (in place) with forks
+    of their own, so neither writes to the shared values again.
+    Series can be lists, SpilledSeries or ForkedSeries. Forks of spilled
+    series spill to files of their own, see fork_tail(), and the shared
+    spilled values are written out, see SpilledSeries.freeze().
+    """
+    forked = dict({})
+    for metric, series in history.items():
+        if isinstance(series, ForkedSeries):
+            segments = series.frozen()
+        else:
+            segments = [(series, len(series))]
+        history[metric] = ForkedSeries(segments, fork_tail(series))
+        forked[metric] = ForkedSeries(list(segments), fork_tail(series))
+        for values, length in segments:
+            if isinstance(values, SpilledSeries):
+                values.freeze()
+    return forked
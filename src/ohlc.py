@@ -0,0 +1,145 @@
+
+import numpy as np
+
+
+CANDLE_FIELDS = ['open', 'high', 'low', 'close']
+
+
+
+def bucket_starts(num_prices, num_sections=None, bucket_size=None):
+    """
+    first index of each candle: num_sections candles split like
+    np.array_split(), or one candle per bucket_size prices
+    """
+    if bucket_size is not None:
+        return np.arange(0, num_prices, bucket_size)
+    num_sections = min(num_sections, num_prices)
+    # np.array_split(): the first num_prices % num_sections sections are one longer
+    size, extra = divmod(num_prices, num_sections)
+    sizes = np.full(num_sections, size)
+    sizes[:extra] += 1
+    return np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+
+def candles(prices, num_sections=None, bucket_size=None):
+    """
+    Open/high/low/close candles of a price series, without a Python loop:
+    highs and lows are np.maximum.reduceat()/np.minimum.reduceat() over the
+    bucket boundaries. Gives one of num_sections or bucket_size.
+    Returns dict of field -> array, plus 'start': first step of each candle
+    """
+    prices = np.asarray(prices, dtype=float)
+    starts = bucket_starts(len(prices), num_sections, bucket_size)
+    ends = np.append(starts[1:], len(prices))
+    return dict({
+        'start': starts,
+        'open': prices[starts],
+        'high': np.maximum.reduceat(prices, starts),
+        'low': np.minimum.reduceat(prices, starts),
+        'close': prices[ends - 1],
+    })
+
+
+
+class OnlineCandles:
+    """
+    Candles of bucket_size prices, built one price at a time while a pool
+    trades (see Uniswap.track_candles()). Memory is one candle per bucket,
+    so the price history never needs to be kept.
+    Gives the same candles as candles(prices, bucket_size=bucket_size).
+    """
+
+    def __init__(self, bucket_size):
+        self.bucket_size = bucket_size
+        self.count = 0
+        # finished candles
+        self.finished = dict({ field: [] for field in CANDLE_FIELDS })
+        # candle being built
+        self.current = None
+
+
+    def __repr__(self):
+        return "OnlineCandles(bucket_size={}, prices={}, candles={})".format(
+            self.bucket_size,
+            self.count,
+            len(self),
+        )
+
+
+    def __len__(self):
+        return len(self.finished['open']) + (self.current is not None)
+
+
+    def update(self, price):
+        if self.current is None:
+            self.current = dict({ 'open': price, 'high': price, 'low': price, 'close': price })
+        else:
+            self.current['high'] = max(self.current['high'], price)
+            self.current['low'] = min(self.current['low'], price)
+            self.current['close'] = price
+        self.count += 1
+        if self.count % self.bucket_size == 0:
+            for field in CANDLE_FIELDS:
+                self.finished[field].append(self.current[field])
+            self.current = None
+
+
+    def snapshot(self):
+        """the candles' state, to restore() after trying prices out"""
+        current = None if self.current is None else dict(self.current)
+        return (self.count, current, len(self.finished['open']))
+
+
+    def restore(self, snapshot):
+        self.count, current, num_finished = snapshot
+        self.current = None if current is None else dict(current)
+        for field in CANDLE_FIELDS:
+            del self.finished[field][num_finished:]
+
+
+    def candles(self):
+        """the candles so far, including the unfinished one, in the format of candles()"""
+        result = dict({
+            field: np.array(
+                self.finished[field] + ([self.current[field]] if self.current is not None else []),
+                dtype=float,
+            )
+            for field in CANDLE_FIELDS
+        })
+        result['start'] = np.arange(len(self)) * self.bucket_size
+        return result
+
+
+
+def plot_candles(ohlc, ax=None, title='DSD, simulated trades', ylabel='Price DSD/USDC'):
+    """
+    Candlestick chart with matplotlib: a wick from low to high and a body
+    from open to close, green when the price rose and red when it fell.
+    ohlc: dict of field -> array, see candles()
+    """
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        fig, ax = plt.subplots()
+    fig = ax.figure
+
+    x = np.arange(len(ohlc['open']))
+    rising = ohlc['close'] >= ohlc['open']
+    colors = np.where(rising, 'tab:green', 'tab:red')
+    ax.vlines(x, ohlc['low'], ohlc['high'], colors=colors, linewidth=1)
+    ax.bar(
+        x,
+        np.abs(ohlc['close'] - ohlc['open']),
+        bottom=np.minimum(ohlc['open'], ohlc['close']),
+        color=colors,
+        width=0.6,
+    )
+    ax.set_title(title)
+    ax.set_xlabel('trades')
+    ax.set_ylabel(ylabel)
+    # label candles with the trade they start at
+    ticks = ax.get_xticks()
+    ticks = ticks[(ticks >= 0) & (ticks < len(x))].astype(int)
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(ohlc['start'][ticks])
+    return fig, ax
@@ -0,0 +1,182 @@
+
+import numpy as np
+# pyplot is imported inside the functions that make figures with it, see render_scenario()
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+from src.decimate import lttb, minmax_decimate
+from src.pyramid import bucket_size_for, bucket_x, downsample
+from src.runner import AVERAGE_KEYS
+from src.scenario import scenario_colors
+
+
+
+def pixel_width(ax):
+    """width of the axes in pixels, the most points a line can show"""
+    return max(int(np.ceil(ax.get_window_extent().width)), 1)
+
+
+def plot_level(result, name, max_points, method='minmax'):
+    """
+    (xs, lines) of a recorded metric (one line per path) or an average
+    (one line), decimated to about max_points points per line:
+        'minmax': the lowest and highest point of each of max_points buckets
+        'lttb': Largest-Triangle-Three-Buckets, max_points points
+        'mean': bucket means
+    Results kept in a ResultsStore read its precomputed level (except for
+    'lttb', which needs the full paths), others are decimated here.
+    xs is one x array for every line, or one per line.
+    """
+    if 'store' in result and method != 'lttb':
+        level = result['store'].read_level(result['series'], name, max_points)
+        if method == 'mean' or level['bucket'] == 1:
+            return level['x'], level['mean']
+        # a vertical stroke from min to max per bucket
+        lines = np.stack([level['min'], level['max']], axis=-1).reshape(len(level['min']), -1)
+        return np.repeat(level['x'], 2), lines
+
+    if name in AVERAGE_KEYS.values():
+        lines = np.atleast_2d(result[name])
+    else:
+        lines = np.asarray(result['paths'].get(name, []), dtype=float)
+        if len(lines) == 0:
+            return np.zeros(0), lines.reshape(0, 0)
+    num_steps = lines.shape[-1]
+    x = np.arange(num_steps)
+    if num_steps <= max_points:
+        return x, lines
+    if method == 'lttb':
+        return lttb(x, lines, max_points)
+    if method == 'minmax':
+        return minmax_decimate(x, lines, max_points)
+    bucket = bucket_size_for(num_steps, max_points)
+    return bucket_x(num_steps, bucket), downsample(lines, bucket)['mean']
+
+
+def plot_lines(ax, xs, lines, **kwargs):
+    """draws every line as a single LineCollection artist, see plot_level()"""
+    if len(lines) == 0:
+        return None
+    xs = np.broadcast_to(xs, lines.shape)
+    collection = LineCollection(np.stack([xs, lines], axis=-1), **kwargs)
+    ax.add_collection(collection, autolim=True)
+    ax.autoscale_view()
+    return collection
+
+
+def plot_scenario(results, scenario, variate=None, ax=None, max_points=None, method='minmax'):
+    """
+    Plots every recorded path of each tax style faintly,
+    with the average over all paths as a dotted line on top.
+    Titles, labels, text box and legend come from scenario['plot'].
+    max_points, method: decimation of each line, see plot_level().
+        max_points defaults to the axes' width in pixels
+    """
+    plot = scenario['plot']
+    variate = variate or plot.get('variate', 'prices')
+    colors = scenario_colors(scenario)
+    if ax is None:
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+    fig = ax.figure
+    max_points = max_points or pixel_width(ax)
+
+    for tax_style, result in results.items():
+        xs, paths = plot_level(result, variate, max_points, method)
+        plot_lines(
+            ax,
+            xs,
+            paths,
+            colors=colors[tax_style],
+            alpha=plot.get('alpha', 0.1),
+        )
+        # Then plot mean line with alpha=1
+        xs, average = plot_level(result, AVERAGE_KEYS[variate], max_points, method)
+        plot_lines(
+            ax,
+            xs,
+            average,
+            colors=colors[tax_style],
+            alpha=1,
+            linewidths=2,
+            linestyles="dotted",
+        )
+
+    ax.set_title(plot.get('title', scenario.get('name', '')))
+    ax.set_xlabel(plot.get('xlabel', "number of trades"))
+    ax.set_ylabel(plot.get('ylabel', variate))
+    if plot.get('text'):
+        plot_text_box(ax, results, scenario)
+    plot_legend(ax, scenario, plot.get('legend_loc', 'upper left'))
+    return fig, ax
+
+
+def render_scenario(results, scenario, path, figsize=(8, 5), dpi=150, **kwargs):
+    """
+    Draws plot_scenario() on a figure of its own, rendered with the Agg
+    backend (or SVG, by the file extension) without pyplot or a display.
+    """
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    plot_scenario(results, scenario, ax=fig.add_subplot(), **kwargs)
+    fig.savefig(path)
+    return fig
+
+
+def plot_averages(results, scenario, variate='treasury_balances', tax_styles=None, ax=None, max_points=None, method='minmax'):
+    """plots only the average line of each tax style, e.g. treasury balances"""
+    colors = scenario_colors(scenario)
+    tax_styles = tax_styles or list(results.keys())
+    if ax is None:
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+    fig = ax.figure
+    max_points = max_points or pixel_width(ax)
+
+    for tax_style in tax_styles:
+        xs, average = plot_level(results[tax_style], AVERAGE_KEYS[variate], max_points, method)
+        plot_lines(
+            ax,
+            xs,
+            average,
+            colors=colors[tax_style],
+            alpha=1,
+            linewidths=2,
+            linestyles="dotted",
+        )
+    plot_legend(ax, scenario, 'upper left', tax_styles)
+    return fig, ax
+
+
+def plot_text_box(ax, results, scenario):
+    """
+    places scenario['plot']['text'] on the axes, formatted with
+    {runs}, {nobs}, {mu} and {sigma}
+    """
+    plot = scenario['plot']
+    x, y = plot.get('text_position', [0.02, 0.02])
+    ax.text(
+        x, y,
+        plot['text'].format(
+            runs=sum(r['num_paths'] for r in results.values()),
+            nobs=scenario['trades']['nobs'],
+            mu=scenario['trades']['mu'],
+            sigma=scenario['trades']['sigma'],
+        ),
+        {'color': 'black', 'fontsize': 8},
+        verticalalignment='bottom',
+        bbox=dict(boxstyle='round', facecolor='white', alpha=0.5)
+    )
+
+
+def plot_legend(ax, scenario, loc, tax_styles=None):
+    colors = scenario_colors(scenario)
+    tax_styles = tax_styles or list(scenario['tax_styles'].keys())
+    legend_elements = [
+        Line2D([0], [0], color=colors[tax_style], lw=2,
+               label=scenario['tax_styles'][tax_style].get('label', tax_style))
+        for tax_style in tax_styles
+    ]
+    ax.legend(handles=legend_elements, loc=loc)
@@ -0,0 +1,76 @@
+
+import numpy as np
+
+
+# coarsest level kept, in buckets per path
+MIN_POINTS = 64
+
+LEVEL_FIELDS = ['mean', 'min', 'max']
+
+
+
+def bucket_size_for(num_steps, max_points):
+    """smallest power of two bucket size giving at most max_points buckets (1: no downsampling)"""
+    bucket = 1
+    while -(-num_steps // bucket) > max_points:
+        bucket *= 2
+    return bucket
+
+
+def bucket_x(num_steps, bucket):
+    """step at the centre of each bucket, to plot downsampled values against"""
+    starts = np.arange(0, num_steps, bucket)
+    ends = np.minimum(starts + bucket, num_steps)
+    return (starts + ends - 1) / 2
+
+
+def downsample(values, bucket):
+    """
+    per-bucket mean/min/max of values along the last axis (steps),
+    buckets of bucket steps, the last one possibly shorter
+    """
+    values = np.asarray(values, dtype=float)
+    starts = np.arange(0, values.shape[-1], bucket)
+    counts = np.diff(np.append(starts, values.shape[-1]))
+    return dict({
+        'mean': np.add.reduceat(values, starts, axis=-1) / counts,
+        'min': np.minimum.reduceat(values, starts, axis=-1),
+        'max': np.maximum.reduceat(values, starts, axis=-1),
+    })
+
+
+def next_level(level, num_steps, bucket):
+    """the level with twice the bucket size, from the level with bucket size bucket"""
+    num_buckets = level['mean'].shape[-1]
+    pairs = np.arange(0, num_buckets, 2)
+    # steps in each bucket of the finer level, only the last one can be short
+    counts = np.full(num_buckets, bucket)
+    counts[-1] = num_steps - bucket * (num_buckets - 1)
+    sums = np.add.reduceat(level['mean'] * counts, pairs, axis=-1)
+    return dict({
+        'mean': sums / np.add.reduceat(counts, pairs),
+        'min': np.minimum.reduceat(level['min'], pairs, axis=-1),
+        'max': np.maximum.reduceat(level['max'], pairs, axis=-1),
+    })
+
+
+def pyramid(values, min_points=MIN_POINTS):
+    """
+    Downsampled levels of values (paths x steps, or one series) at bucket
+    sizes 2, 4, 8, ... down to about min_points buckets, each level built
+    from the one before.
+    Returns dict of bucket size -> dict of 'mean'/'min'/'max' arrays
+    """
+    values = np.asarray(values, dtype=float)
+    num_steps = values.shape[-1]
+    levels = dict({})
+    bucket = 2
+    level = None
+    while -(-num_steps // bucket) >= min_points:
+        if level is None:
+            level = downsample(values, bucket)
+        else:
+            level = next_level(level, num_steps, bucket // 2)
+        levels[bucket] = level
+        bucket *= 2
+    return levels
@@ -1,7 +1,16 @@
 import numpy as np
 
-def generate_trade(mu, sigma):
-    rv = np.random.normal(mu, sigma)
+def generate_trade(mu, sigma, rng=None):
+    """
+    rng: a np.random.Generator for seeded streams,
+    otherwise the global np.random state is used
+    """
+    rv = (rng or np.random).normal(mu, sigma)
+    return trade_from_amount(rv)
+
+
+def trade_from_amount(rv):
+    """trade dict for a signed amount: buys > 0, sells < 0"""
     if rv >= 0:
         return dict({ 'type': "buy", 'amount': rv })
     else:
@@ -28,3 +37,12 @@ def bayes_update_normal(
         "sigma": np.sqrt(new_variance),
         "variance": new_variance,
     })
+
+
+def block_rng(seed, block):
+    """
+    Independent random stream for one block of Monte Carlo paths.
+    The same (seed, block) always gives the same stream, whichever
+    process runs the block, so tax styles see the same trades.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block,)))
@@ -0,0 +1,134 @@
+
+import numpy as np
+
+from src.ohlc import bucket_starts
+
+
+# values per block, windows spanning two blocks or more are answered in O(1)
+DEFAULT_BLOCK_SIZE = 64
+
+
+
+class RangeIndex:
+    """
+    Min/max/first/last of any window [start, stop) of a finished series,
+    e.g. history['prices'], without rescanning it.
+
+    Block decomposition: the series is cut into blocks of block_size values.
+    Each value knows the min/max from its block's start up to it (prefix)
+    and from it to its block's end (suffix), and a sparse table holds the
+    min/max of every run of 2^k whole blocks. A window spanning two blocks
+    or more is then the suffix of its first block, the prefix of its last,
+    and two overlapping sparse table runs covering the blocks in between:
+    constant time. Windows inside one block scan at most block_size values
+    (block_size=1 makes every query constant time, at log2(n) times the memory).
+
+    Every query takes arrays of windows, so re-bucketing candles at any
+    resolution costs O(number of candles), see candles().
+    """
+
+    def __init__(self, values, block_size=DEFAULT_BLOCK_SIZE):
+        self.values = np.asarray(values, dtype=float)
+        self.block_size = block_size
+        n = len(self.values)
+        num_blocks = -(-n // block_size)
+
+        blocks = dict({})
+        for name, fill in [('min', np.inf), ('max', -np.inf)]:
+            padded = np.full(num_blocks * block_size, fill)
+            padded[:n] = self.values
+            blocks[name] = padded.reshape(num_blocks, block_size)
+
+        self.prefix = dict({
+            'min': np.minimum.accumulate(blocks['min'], axis=1).reshape(-1)[:n],
+            'max': np.maximum.accumulate(blocks['max'], axis=1).reshape(-1)[:n],
+        })
+        self.suffix = dict({
+            'min': np.minimum.accumulate(blocks['min'][:, ::-1], axis=1)[:, ::-1].reshape(-1)[:n],
+            'max': np.maximum.accumulate(blocks['max'][:, ::-1], axis=1)[:, ::-1].reshape(-1)[:n],
+        })
+
+        # table[name][k, b]: min/max of blocks b to b + 2^k
+        self.table = dict({})
+        for name, reduce in [('min', np.minimum), ('max', np.maximum)]:
+            levels = [getattr(blocks[name], name)(axis=1)]
+            while 2 ** len(levels) <= num_blocks:
+                half = 2 ** (len(levels) - 1)
+                previous = levels[-1]
+                level = previous.copy()
+                level[:num_blocks - half] = reduce(previous[:num_blocks - half], previous[half:])
+                levels.append(level)
+            self.table[name] = np.array(levels)
+
+
+    def __repr__(self):
+        return "RangeIndex(length={}, block_size={})".format(len(self), self.block_size)
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def query(self, name, start, stop):
+        """'min' or 'max' of each window [start, stop), stop > start"""
+        reduce = np.minimum if name == 'min' else np.maximum
+        start = np.atleast_1d(np.asarray(start, dtype=np.int64))
+        stop = np.atleast_1d(np.asarray(stop, dtype=np.int64))
+        last = stop - 1
+        first_block = start // self.block_size
+        last_block = last // self.block_size
+        result = np.empty(len(start))
+
+        # windows spanning two blocks or more
+        wide = first_block < last_block
+        result[wide] = reduce(self.suffix[name][start[wide]], self.prefix[name][last[wide]])
+        # whole blocks in between
+        inner = wide & (last_block - first_block >= 2)
+        lo = first_block[inner] + 1
+        hi = last_block[inner]
+        k = np.floor(np.log2(hi - lo)).astype(np.int64)
+        result[inner] = reduce(result[inner], reduce(
+            self.table[name][k, lo],
+            self.table[name][k, hi - 2 ** k],
+        ))
+
+        # windows inside one block, reduceat() over [start, stop) pairs
+        narrow = ~wide
+        if np.any(narrow):
+            padded = np.append(self.values, 0)
+            bounds = np.stack([start[narrow], stop[narrow]], axis=1).reshape(-1)
+            result[narrow] = reduce.reduceat(padded, bounds)[::2]
+        return result
+
+
+    def min(self, start, stop):
+        return self.query('min', start, stop)
+
+
+    def max(self, start, stop):
+        return self.query('max', start, stop)
+
+
+    def first(self, start, stop):
+        return self.values[np.asarray(start)]
+
+
+    def last(self, start, stop):
+        return self.values[np.asarray(stop) - 1]
+
+
+    def candles(self, num_sections=None, bucket_size=None, start=0, stop=None):
+        """
+        candles of the window [start, stop), in the format of src.ohlc.candles(),
+        e.g. to zoom in on part of a long run at any resolution
+        """
+        stop = len(self) if stop is None else stop
+        starts = start + bucket_starts(stop - start, num_sections, bucket_size)
+        ends = np.append(starts[1:], stop)
+        return dict({
+            'start': starts,
+            'open': self.first(starts, ends),
+            'high': self.max(starts, ends),
+            'low': self.min(starts, ends),
+            'close': self.last(starts, ends),
+        })
@@ -0,0 +1,202 @@
+
+import json
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from src.pyramid import LEVEL_FIELDS, MIN_POINTS, bucket_size_for, bucket_x, pyramid
+
+
+
+class ResultsStore:
+    """
+    Per-path histories on disk, one (paths x steps) .npy matrix per
+    series (e.g. a tax style) and metric, with a JSON manifest:
+
+        root/manifest.json
+        root/<series>/<metric>.npy
+
+    Matrices are allocated for the most paths a run can take, and filled
+    block by block: each work unit writes its own rows through a memory map,
+    so workers write concurrently without holding paths in memory.
+    Reads are memory maps too, so slices are only loaded when used.
+
+    build_pyramid() adds downsampled levels (per-bucket mean/min/max at
+    bucket sizes 2, 4, 8, ...) so plots of long runs read only as many
+    points as they can show, see read_level():
+        root/<series>/<metric>.L<bucket size>.npy
+    """
+
+    def __init__(self, root, dtype='float64'):
+        self.root = root
+        self.dtype = np.dtype(dtype)
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest = self.load_manifest()
+
+
+    def __repr__(self):
+        return "ResultsStore(root={}, series={})".format(self.root, len(self.manifest['series']))
+
+
+    def __getstate__(self):
+        # workers only need file paths, see run_block()
+        return dict({ 'root': self.root, 'dtype': self.dtype.str })
+
+
+    def __setstate__(self, state):
+        self.__init__(state['root'], state['dtype'])
+
+
+    def load_manifest(self):
+        path = os.path.join(self.root, 'manifest.json')
+        if not os.path.exists(path):
+            return dict({ 'series': dict({}) })
+        with open(path) as f:
+            return json.load(f)
+
+
+    def save_manifest(self):
+        path = os.path.join(self.root, 'manifest.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, path)
+
+
+    def file(self, series, metric):
+        return os.path.join(self.root, series_name(series), metric + '.npy')
+
+
+    def create(self, series, metric, num_paths, num_steps):
+        """allocates a (num_paths, num_steps) matrix, returns its file path"""
+        path = self.file(series, metric)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open_memmap(path, mode='w+', dtype=self.dtype, shape=(num_paths, num_steps))
+        self.manifest['series'].setdefault(series_name(series), dict({}))[metric] = dict({
+            'file': os.path.relpath(path, self.root),
+            'shape': [num_paths, num_steps],
+            'dtype': self.dtype.str,
+            # rows holding finished paths
+            'rows': 0,
+        })
+        self.save_manifest()
+        return path
+
+
+    def set_rows(self, series, rows):
+        """records how many rows of every metric of series hold finished paths"""
+        for entry in self.manifest['series'][series_name(series)].values():
+            entry['rows'] = rows
+        self.save_manifest()
+
+
+    def put(self, series, name, values):
+        """stores a whole matrix (or a single series as one row), e.g. an average"""
+        values = np.atleast_2d(values)
+        path = self.create(series, name, values.shape[0], values.shape[1])
+        write_rows(path, 0, values)
+        self.manifest['series'][series_name(series)][name]['rows'] = values.shape[0]
+        self.save_manifest()
+
+
+    def build_pyramid(self, series, metric, min_points=MIN_POINTS, chunk_rows=256):
+        """
+        writes the downsampled levels of a metric's finished paths, chunk_rows
+        paths at a time. Each level is a (3, paths, buckets) matrix of
+        mean, min and max, see src/pyramid.py
+        """
+        entry = self.manifest['series'][series_name(series)][metric]
+        rows = entry['rows']
+        matrix = self.read(series, metric)
+        levels = dict({})
+        for start in range(0, rows, chunk_rows):
+            chunk = pyramid(np.asarray(matrix[start:start + chunk_rows]), min_points)
+            for bucket, level in chunk.items():
+                if bucket not in levels:
+                    path = os.path.join(
+                        os.path.dirname(self.file(series, metric)),
+                        "{}.L{}.npy".format(metric, bucket),
+                    )
+                    levels[bucket] = path
+                    shape = (len(LEVEL_FIELDS), rows, level['mean'].shape[-1])
+                    open_memmap(path, mode='w+', dtype=self.dtype, shape=shape)
+                out = open_memmap(levels[bucket], mode='r+')
+                for i, field in enumerate(LEVEL_FIELDS):
+                    out[i, start:start + len(level[field])] = level[field]
+                out.flush()
+                del out
+        entry['levels'] = dict({
+            str(bucket): os.path.relpath(path, self.root) for bucket, path in levels.items()
+        })
+        self.save_manifest()
+
+
+    def read_level(self, series, metric, max_points, start=0, stop=None):
+        """
+        the finished paths [start:stop] of a metric at the finest stored
+        resolution with at most max_points points per path (or the coarsest
+        level there is). Returns dict of 'x' (step of each point),
+        'mean'/'min'/'max' memory maps of (paths, points) and 'bucket'
+        (steps per point)
+        """
+        entry = self.manifest['series'][series_name(series)][metric]
+        num_steps = entry['shape'][1]
+        levels = entry.get('levels', dict({}))
+        bucket = bucket_size_for(num_steps, max_points)
+        if bucket > 1 and len(levels) > 0:
+            bucket = min(bucket, max(int(b) for b in levels))
+            stop = entry['rows'] if stop is None else min(stop, entry['rows'])
+            level = np.load(os.path.join(self.root, levels[str(bucket)]), mmap_mode='r')
+            result = dict({
+                field: level[i, start:stop] for i, field in enumerate(LEVEL_FIELDS)
+            })
+            result['x'] = bucket_x(num_steps, bucket)
+            result['bucket'] = bucket
+            return result
+
+        values = self.read(series, metric, start, stop)
+        result = dict({ field: values for field in LEVEL_FIELDS })
+        result['x'] = np.arange(num_steps)
+        result['bucket'] = 1
+        return result
+
+
+    def series(self):
+        """names of the stored series"""
+        return list(self.manifest['series'].keys())
+
+
+    def metrics(self, series):
+        return list(self.manifest['series'][series_name(series)].keys())
+
+
+    def read(self, series, metric, start=0, stop=None):
+        """
+        read-only memory map of the finished paths [start:stop] of a metric,
+        nothing is loaded until the rows are used
+        """
+        entry = self.manifest['series'][series_name(series)][metric]
+        matrix = np.load(os.path.join(self.root, entry['file']), mmap_mode='r')
+        stop = entry['rows'] if stop is None else min(stop, entry['rows'])
+        return matrix[start:stop]
+
+
+    def paths(self, series):
+        """dict of metric -> memory map of every finished path, like results['paths']"""
+        return dict({ metric: self.read(series, metric) for metric in self.metrics(series) })
+
+
+
+def series_name(series):
+    """directory name of a series, e.g. a tax style or (sweep variant, tax style)"""
+    if isinstance(series, tuple):
+        series = "/".join(str(part) for part in series)
+    return str(series)
+
+
+def write_rows(path, start, rows):
+    """writes rows into the matrix at path from row start, used by workers"""
+    matrix = open_memmap(path, mode='r+')
+    matrix[start:start + len(rows)] = rows
+    matrix.flush()
+    del matrix
@@ -0,0 +1,788 @@
+
+import numpy as np
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from src.cache import code_fingerprint, config_key
+from src.curve_amm import Curve
+from src.uniswap_amm import Uniswap
+from src.ensemble import CurveEnsemble, UniswapEnsemble, absorbed
+from src.random import block_rng, generate_trade, trade_from_amount
+from src.results_store import write_rows
+from src.shared_arrays import SharedArrays, attach_shared, release_shared
+from src.slippage_surface import surface_for
+from src.streaming_stats import RunningStats
+from src.tax_functions import uses_twap
+
+
+AMMS = dict({
+    'uniswap': Uniswap,
+    'curve': Curve,
+})
+
+ENSEMBLES = dict({
+    'uniswap': UniswapEnsemble,
+    'curve': CurveEnsemble,
+})
+
+# metrics recorded in each pool's history
+METRICS = ['prices', 'burns', 'treasury_balances']
+
+# key each metric's average is stored under, same names as the drivers
+AVERAGE_KEYS = dict({
+    'prices': 'avg_prices',
+    'burns': 'avg_burns',
+    'treasury_balances': 'avg_treasury_balances',
+})
+
+
+
+def create_pool(amm, lp_initial_usdc, lp_initial_dsd, A=None, history=None, slippage_surface=None):
+    """
+    builds a fresh Uniswap or Curve pool.
+    slippage_surface: SlippageSurface options (dict({}) for the defaults) to
+        look the slippage tax up in a table solved at the pool's initial depth,
+        see src/slippage_surface.py
+    """
+    if amm == 'curve':
+        pool = Curve(lp_initial_usdc, lp_initial_dsd, A=A, history=history)
+    else:
+        A = None
+        pool = AMMS[amm](lp_initial_usdc, lp_initial_dsd, history=history)
+    if slippage_surface is not None:
+        pool.slippage_surface = surface_for(amm, A, lp_initial_dsd, **slippage_surface)
+    return pool
+
+
+def create_ensemble(amm, num_paths, lp_initial_usdc, lp_initial_dsd, A=None, absorbing=None):
+    """builds a batch of num_paths Uniswap or Curve pools"""
+    if amm == 'curve':
+        return CurveEnsemble(num_paths, lp_initial_usdc, lp_initial_dsd, A=A, absorbing=absorbing)
+    return ENSEMBLES[amm](num_paths, lp_initial_usdc, lp_initial_dsd, absorbing=absorbing)
+
+
+def simulate_path(
+    amm,
+    tax_function,
+    lp_initial_usdc,
+    lp_initial_dsd,
+    mu,
+    sigma,
+    nobs,
+    A=None,
+    absorbing=None,
+    adaptive=None,
+    rng=None,
+    history=None,
+    trades=None,
+    slippage_surface=None,
+):
+    """
+    runs one Monte Carlo path of nobs trades.
+    Once the pool reaches an absorbing state its last values are carried forward.
+
+    adaptive: traders that react to prices, dict({ 'num_updates', 'scale', 'mu_cap' }).
+        The path is split into num_updates blocks, and after each block the
+        mean of the trade distribution becomes mean(block prices) * scale,
+        capped at mu_cap.
+    rng: np.random.Generator to draw trades from, see generate_trade()
+    history: the pool's history series, e.g. spilled_history() for paths
+        too long to keep in memory. Trades are drawn as they are made.
+    trades: nobs pregenerated signed trade amounts, instead of drawing them
+    slippage_surface: SlippageSurface options, see create_pool()
+    Returns (pool, absorption), absorption being None or dict({ 'step', 'reason' })
+    """
+    if tax_function != "slippage":
+        slippage_surface = None
+    pool = create_pool(amm, lp_initial_usdc, lp_initial_dsd, A, history, slippage_surface)
+    if uses_twap(tax_function):
+        pool.track_twap()
+    if adaptive:
+        blocks = np.array_split(np.arange(nobs), adaptive['num_updates'])
+    else:
+        blocks = [range(nobs)]
+
+    absorption = None
+    for block in blocks:
+        # same draws as drawing the whole block up front, swaps don't use rng
+        if trades is None:
+            block_trades = (generate_trade(mu, sigma, rng) for x in block)
+        else:
+            block_trades = (trade_from_amount(trades[t]) for t in block)
+        block_prices = []
+
+        for t, trade in zip(block, block_trades):
+            if absorption is not None:
+                price = pool.carry_forward()
+            else:
+                price = pool.swap(trade, tax_function=tax_function)
+                if absorbing and pool.failure is None:
+                    done, conditions = absorbed(absorbing, dict({
+                        'price': pool.history['prices'][-1],
+                        'balance_x': pool.balance_x,
+                        'balance_y': pool.balance_y,
+                        'treasury': pool.history['treasury_balances'][-1],
+                    }))
+                    if done:
+                        absorption = dict({ 'step': int(t), 'reason': conditions[()] })
+            if adaptive:
+                block_prices.append(price)
+
+        if adaptive:
+            # prevent mu from exploding upwards
+            mu = min(np.mean(block_prices) * adaptive['scale'], adaptive['mu_cap'])
+
+    return pool, absorption
+
+
+def simulate_paths(
+    amm,
+    tax_function,
+    lp_initial_usdc,
+    lp_initial_dsd,
+    mu,
+    sigma,
+    nobs,
+    num_paths,
+    A=None,
+    backend='serial',
+    absorbing=None,
+    adaptive=None,
+    rng=None,
+    trades=None,
+    slippage_surface=None,
+):
+    """
+    Runs num_paths Monte Carlo paths of nobs trades.
+    backend: 'serial' steps one Uniswap/Curve pool at a time,
+        'ensemble' steps all paths together with NumPy
+    absorbing: dict of absorbing condition -> threshold, see ABSORBING_CONDITIONS
+    adaptive: price feedback traders, see simulate_path() (serial backend only)
+    trades: (num_paths, nobs) pregenerated signed trade amounts, the same as
+        drawing them from rng, see draw_trades()
+    slippage_surface: SlippageSurface options for the slippage tax, see
+        create_pool() (serial backend only)
+    Returns (histories, failures, absorptions): a list of history dicts,
+    one per path, and lists of failure and absorption dicts (None for paths
+    that did not fail or were not absorbed)
+    """
+    if backend == 'serial':
+        runs = [
+            simulate_path(
+                amm,
+                tax_function,
+                lp_initial_usdc,
+                lp_initial_dsd,
+                mu,
+                sigma,
+                nobs,
+                A=A,
+                absorbing=absorbing,
+                adaptive=adaptive,
+                rng=rng,
+                trades=None if trades is None else trades[i],
+                slippage_surface=slippage_surface,
+            )
+            for i in range(num_paths)
+        ]
+        return (
+            [pool.history for pool, absorption in runs],
+            [pool.failure for pool, absorption in runs],
+            [absorption for pool, absorption in runs],
+        )
+
+    if adaptive:
+        raise ValueError("adaptive traders need the serial backend")
+    if uses_twap(tax_function):
+        raise ValueError("TWAP taxes need the serial backend")
+    if tax_function == "slippage":
+        raise ValueError("the slippage tax needs the serial backend")
+
+    if trades is None:
+        trades = draw_trades(mu, sigma, num_paths, nobs, rng)
+    ensemble = create_ensemble(amm, num_paths, lp_initial_usdc, lp_initial_dsd, A, absorbing)
+    history = ensemble.run(trades, tax_function)
+
+    histories = [
+        dict({ metric: history[metric][i] for metric in METRICS })
+        for i in range(num_paths)
+    ]
+    failures = [
+        dict({
+            'step': int(ensemble.failed_step[i]),
+            'reason': ensemble.failure_reason[i],
+        }) if ensemble.failed_step[i] >= 0 else None
+        for i in range(num_paths)
+    ]
+    absorptions = [
+        dict({
+            'step': int(ensemble.absorbed_step[i]),
+            'reason': ensemble.absorbed_reason[i],
+        }) if ensemble.absorbed_step[i] >= 0 else None
+        for i in range(num_paths)
+    ]
+    return histories, failures, absorptions
+
+
+def draw_trades(mu, sigma, num_paths, nobs, rng=None):
+    """
+    (num_paths, nobs) signed trade amounts, drawn in the same order as
+    generate_trade() draws them path by path
+    """
+    return (rng or np.random).normal(mu, sigma, size=(num_paths, nobs))
+
+
+def first_passage_statistics(events, nobs):
+    """
+    First-passage statistics for paths that failed (e.g. drained the pool)
+    or were absorbed.
+    events: list of dict({ 'step', 'reason' }), None for paths without an event
+    """
+    steps = [e['step'] for e in events if e is not None]
+    return dict({
+        'count': len(steps),
+        'rate': len(steps) / len(events) if len(events) else 0,
+        # mean step of the trade that triggered the event
+        'mean_step': np.mean(steps) if len(steps) else None,
+        # fraction of paths that had the event by each step
+        'by_step': np.cumsum(np.bincount(steps, minlength=nobs)[:nobs]) / max(len(events), 1),
+        'steps': steps,
+        'reasons': dict(Counter(e['reason'] for e in events if e is not None)),
+    })
+
+
+def path_statistic(history, statistic):
+    """
+    summary statistic of a single path, used for the stopping rule:
+        'prices': final price
+        'treasury_balances': final treasury balance
+        'burns': total burns
+    """
+    if statistic == 'burns':
+        return np.sum(history['burns'])
+    return history[statistic][-1]
+
+
+
+# keyword arguments of simulate_paths() that set up a tax style's paths
+SIMULATION_KEYS = [
+    'amm',
+    'tax_function',
+    'lp_initial_usdc',
+    'lp_initial_dsd',
+    'mu',
+    'sigma',
+    'nobs',
+    'A',
+    'backend',
+    'absorbing',
+    'adaptive',
+    'slippage_surface',
+]
+
+
+def run_block(
+    simulation,
+    num_paths,
+    block,
+    seed,
+    statistic='prices',
+    record=(),
+    outputs=None,
+    offset=0,
+    trades=None,
+    shared_outputs=None,
+):
+    """
+    A work unit: simulates one block of paths for one tax style with the
+    block's own random stream, and summarises it with streaming statistics.
+    Runs in worker processes, so everything it takes and returns is picklable.
+    outputs: dict of metric -> ResultsStore matrix file, recorded paths of
+        these metrics are written to rows offset onwards instead of returned
+    trades: shared array spec of the block's (num_paths, nobs) trades, drawn
+        once by the parent for every tax style, see run_work_units()
+    shared_outputs: dict of metric -> shared array spec, recorded paths of
+        these metrics are written to them instead of returned
+    """
+    outputs = outputs or dict({})
+    shared_outputs = shared_outputs or dict({})
+    shared = []
+    if trades is not None:
+        shm, trades = attach_shared(trades)
+        shared.append(shm)
+
+    histories, failures, absorptions = simulate_paths(
+        num_paths=num_paths,
+        rng=block_rng(seed, block),
+        trades=trades,
+        **simulation
+    )
+    block_result = summarise_block(histories, failures, absorptions, statistic, record)
+    paths = block_result['paths']
+
+    write_outputs(paths, outputs, offset, simulation['nobs'])
+    for metric, spec in shared_outputs.items():
+        shm, rows = attach_shared(spec)
+        shared.append(shm)
+        rows[...] = np.array(paths[metric]).reshape(rows.shape)
+        paths[metric] = []
+        del rows
+
+    # views into shared memory are gone, detach
+    del trades
+    for shm in shared:
+        release_shared(shm)
+
+    return block_result
+
+
+def summarise_block(histories, failures, absorptions, statistic='prices', record=()):
+    """a block of paths as streaming statistics and recorded paths, what run_block() returns"""
+    averages = dict({ metric: RunningStats() for metric in METRICS })
+    estimate = RunningStats()
+    paths = dict({ metric: [] for metric in record })
+    for history in histories:
+        for metric in METRICS:
+            averages[metric].push(history[metric])
+        for metric in record:
+            paths[metric].append(np.asarray(history[metric], dtype=float))
+        estimate.push(path_statistic(history, statistic))
+    return dict({
+        'averages': averages,
+        'estimate': estimate,
+        'paths': paths,
+        'failures': failures,
+        'absorptions': absorptions,
+    })
+
+
+def write_outputs(paths, outputs, offset, nobs):
+    """writes recorded paths to their ResultsStore matrices from row offset, emptying them in paths"""
+    for metric, path in outputs.items():
+        write_rows(path, offset, np.array(paths[metric]).reshape(-1, nobs + 1))
+        paths[metric] = []
+
+
+
+class TaxStyleRun:
+    """
+    Collects the blocks of one tax style, merging them strictly in block
+    order whatever order they finish in, so results do not depend on how
+    many workers ran them. Decides when the tax style is done.
+    """
+
+    def __init__(self,
+        simulation,
+        num_iterations=50,
+        tolerance=None,
+        statistic='prices',
+        confidence=0.95,
+        batch_size=10,
+        record=(),
+        store=None,
+        series=None,
+    ):
+        self.simulation = simulation
+        self.num_iterations = num_iterations
+        self.tolerance = tolerance
+        self.statistic = statistic
+        self.confidence = confidence
+        self.batch_size = batch_size
+        self.record = record
+
+        self.num_blocks = int(np.ceil(num_iterations / batch_size))
+        self.averages = dict({ metric: RunningStats() for metric in METRICS })
+        self.estimate = RunningStats()
+        self.paths = dict({ metric: [] for metric in record })
+        # recorded paths go to a ResultsStore instead of memory
+        self.store = store
+        self.series = series
+        self.outputs = dict({})
+        if store is not None:
+            self.outputs = dict({
+                metric: store.create(series, metric, num_iterations, simulation['nobs'] + 1)
+                for metric in record
+            })
+        self.failures = []
+        self.absorptions = []
+
+        self.converged = False
+        self.done = self.num_blocks == 0
+        # number of blocks merged so far
+        self.merged = 0
+        # finished blocks waiting for earlier blocks to finish
+        self.pending = dict({})
+
+
+    def next_block(self, block=None):
+        """first block from block on (by default the next to merge) that hasn't finished"""
+        block = self.merged if block is None else block
+        while block in self.pending:
+            block += 1
+        return block
+
+
+    def block_size(self, block):
+        return min(self.batch_size, self.num_iterations - block * self.batch_size)
+
+
+    def work_unit(self, block, seed):
+        """keyword arguments of run_block() for a block"""
+        return dict({
+            'simulation': self.simulation,
+            'num_paths': self.block_size(block),
+            'block': block,
+            'seed': seed,
+            'statistic': self.statistic,
+            'record': self.record,
+            'outputs': self.outputs,
+            'offset': block * self.batch_size,
+        })
+
+
+    def add(self, block, block_result):
+        """adds a finished block, merging every block that is now in order"""
+        self.pending[block] = block_result
+        while not self.done and self.merged in self.pending:
+            self.merge(self.pending.pop(self.merged))
+            self.merged += 1
+
+            # stopping rule, checked after each block in order
+            if self.tolerance is not None and self.estimate.half_width(self.confidence) <= self.tolerance:
+                self.converged = True
+                self.done = True
+            if self.merged == self.num_blocks:
+                self.done = True
+        if self.done:
+            self.pending = dict({})
+
+
+    def merge(self, block_result):
+        for metric in METRICS:
+            self.averages[metric].merge(block_result['averages'][metric])
+        self.estimate.merge(block_result['estimate'])
+        for metric in self.record:
+            self.paths[metric] += block_result['paths'][metric]
+        self.failures += block_result['failures']
+        self.absorptions += block_result['absorptions']
+
+
+    def result(self):
+        nobs = self.simulation['nobs']
+        if self.store is not None:
+            self.store.set_rows(self.series, self.estimate.count)
+            # averages go in the store too, with the paths' downsampled levels
+            for metric in METRICS:
+                self.store.put(self.series, AVERAGE_KEYS[metric], self.averages[metric].mean)
+            for name in list(self.record) + [AVERAGE_KEYS[metric] for metric in METRICS]:
+                self.store.build_pyramid(self.series, name)
+            self.paths = dict({ metric: self.store.read(self.series, metric) for metric in self.record })
+        result = dict({
+            AVERAGE_KEYS[metric]: self.averages[metric].mean for metric in METRICS
+        })
+        result.update(dict({
+            'num_paths': self.estimate.count,
+            'tolerance': self.tolerance,
+            'statistic': self.statistic,
+            'estimate': float(self.estimate.mean),
+            'half_width': float(self.estimate.half_width(self.confidence)),
+            'converged': self.converged,
+            'paths': self.paths,
+            'failures': first_passage_statistics(self.failures, nobs),
+            'absorptions': first_passage_statistics(self.absorptions, nobs),
+        }))
+        if self.store is not None:
+            result['store'] = self.store
+            result['series'] = self.series
+        return result
+
+
+
+def run_configs(configs, seed=None, workers=1, cache=None, refresh=False, checkpoint=None, store=None, shared_pool=False):
+    """
+    Runs several tax styles, splitting each into blocks of paths (work units).
+    configs: dict of tax_style -> run_tax_style() keyword arguments
+    seed: seeds every block's random stream, see block_rng(). Tax styles
+        share the same streams, so they are compared on the same trades.
+    workers: number of processes; results are identical for any number
+    cache: a ResultCache. Seeded tax styles already in the cache are loaded
+        instead of run, unless refresh=True; new results are stored in it.
+    checkpoint: a Checkpoint, the run's state is saved to it periodically
+        and on Ctrl-C, see resume_configs()
+    store: a ResultsStore, recorded paths are written to it by the workers
+        and returned as memory maps
+    shared_pool: tax styles that differ only in their tax function step
+        each path together, sharing one pool until their sells diverge (see
+        run_shared_pool()). Needs the serial backend; runs in this process.
+    Returns dict of tax_style -> results
+    """
+    results = dict({})
+    keys = dict({})
+    if cache is not None and seed is not None:
+        for tax_style, config in configs.items():
+            keys[tax_style] = config_key(config, seed)
+            cached = None if refresh else cache.get(keys[tax_style])
+            if cached is not None:
+                print('Loaded cached results: {}'.format(tax_style))
+                results[tax_style] = cached
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    runs = dict({})
+    for tax_style, config in configs.items():
+        if tax_style in results:
+            continue
+        print('Running tax style: {} ({} backend)'.format(tax_style, config.get('backend', 'serial')))
+        config = dict(config)
+        simulation = dict({ key: config.pop(key) for key in SIMULATION_KEYS if key in config })
+        runs[tax_style] = TaxStyleRun(simulation, store=store, series=tax_style, **config)
+
+    state = dict({
+        'configs': configs,
+        'seed': seed,
+        'runs': runs,
+        'results': results,
+        'keys': keys,
+        'code': code_fingerprint(),
+        'shared_pool': shared_pool,
+    })
+    return finish_runs(state, workers, cache, checkpoint)
+
+
+def resume_configs(checkpoint, workers=1, cache=None):
+    """
+    Continues a run_configs() run from its last checkpoint. Blocks are seeded
+    by their index (see block_rng()) and merged in order, so the results are
+    identical to those of an uninterrupted run.
+    """
+    state = checkpoint.load()
+    if state['code'] != code_fingerprint():
+        raise ValueError(
+            "the simulation code changed since {} was saved, "
+            "resuming would not reproduce the run".format(checkpoint.path)
+        )
+    print('Resuming from {}: {}'.format(checkpoint.path, ', '.join(
+        '{} ({}/{} blocks)'.format(tax_style, run.merged, run.num_blocks)
+        for tax_style, run in state['runs'].items()
+    )))
+    return finish_runs(state, workers, cache, checkpoint)
+
+
+def finish_runs(state, workers=1, cache=None, checkpoint=None):
+    """runs the remaining blocks of every tax style in state, see run_configs()"""
+    runs = state['runs']
+    seed = state['seed']
+
+    def save(force=False):
+        if checkpoint is not None and checkpoint.save(state, force=force):
+            print('Saved checkpoint: {}'.format(checkpoint.path))
+
+    try:
+        if state.get('shared_pool'):
+            # imported here, src/branching.py builds on this module
+            from src.branching import run_shared_pool
+            run_shared_pool(runs, seed, save)
+        elif workers <= 1:
+            for tax_style, run in runs.items():
+                while not run.done:
+                    block = run.next_block()
+                    run.add(block, run_block(**run.work_unit(block, seed)))
+                    save()
+        else:
+            run_work_units(runs, seed, workers, save)
+    except KeyboardInterrupt:
+        save(force=True)
+        raise
+    save(force=True)
+
+    results = state['results']
+    keys = state['keys']
+    for tax_style, run in runs.items():
+        results[tax_style] = run.result()
+        results[tax_style]['seed'] = seed
+        if cache is not None and tax_style in keys:
+            cache.put(keys[tax_style], results[tax_style], state['configs'][tax_style])
+
+    # same order as configs
+    return dict({ tax_style: results[tax_style] for tax_style in state['configs'] })
+
+
+def run_work_units(runs, seed, workers, on_merge=None):
+    """
+    Farms out (tax style, block) work units to a process pool, keeping
+    about two units per worker in flight. Blocks past a tax style's stopping
+    point may be computed, but they are never merged.
+
+    Each block's trades are drawn once, into shared memory, and every tax
+    style with the same trade distribution replays them from there (they are
+    the trades the block's random stream would give). Recorded paths come
+    back through shared memory too, so no large arrays are pickled.
+    on_merge: called after each finished block is added, e.g. to checkpoint
+    """
+    next_block = dict({ tax_style: run.next_block() for tax_style, run in runs.items() })
+    in_flight = dict({})
+    shared = SharedArrays()
+
+    def shared_trades(run, block):
+        simulation = run.simulation
+        if simulation.get('adaptive'):
+            # trades depend on the path's prices
+            return None
+        key = ('trades', simulation['mu'], simulation['sigma'], simulation['nobs'], run.block_size(block), block)
+        if key not in shared:
+            shared.create(key, (run.block_size(block), simulation['nobs']), values=draw_trades(
+                simulation['mu'],
+                simulation['sigma'],
+                run.block_size(block),
+                simulation['nobs'],
+                block_rng(seed, block),
+            ))
+        return key
+
+    def submit(executor):
+        # round-robin over the tax styles that still need blocks
+        while len(in_flight) < 2 * workers:
+            todo = [
+                tax_style for tax_style, run in runs.items()
+                if not run.done and next_block[tax_style] < run.num_blocks
+            ]
+            if len(todo) == 0:
+                return
+            for tax_style in todo:
+                if len(in_flight) >= 2 * workers:
+                    return
+                run = runs[tax_style]
+                block = next_block[tax_style]
+                unit = run.work_unit(block, seed)
+                keys = []
+                trades = shared_trades(run, block)
+                if trades is not None:
+                    unit['trades'] = shared.acquire(trades)
+                    keys.append(trades)
+                unit['shared_outputs'] = dict({})
+                for metric in run.record:
+                    if metric in run.outputs:
+                        continue
+                    key = ('output', tax_style, block, metric)
+                    shared.create(key, (run.block_size(block), run.simulation['nobs'] + 1))
+                    unit['shared_outputs'][metric] = shared.acquire(key)
+                    keys.append(key)
+                in_flight[executor.submit(run_block, **unit)] = (tax_style, block, keys)
+                # skips blocks that finished before a checkpoint
+                next_block[tax_style] = run.next_block(block + 1)
+
+    def collect(block_result, tax_style, block, keys):
+        """copies the recorded paths out of shared memory, then frees it"""
+        for key in keys:
+            if key[0] == 'output':
+                block_result['paths'][key[3]] = list(np.array(shared.array(key)))
+            shared.release(key)
+        return block_result
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            submit(executor)
+            while len(in_flight) > 0:
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    tax_style, block, keys = in_flight.pop(future)
+                    block_result = collect(future.result(), tax_style, block, keys)
+                    run = runs[tax_style]
+                    if not run.done:
+                        run.add(block, block_result)
+                    if run.done:
+                        # cancel work units this tax style no longer needs
+                        for other, (style, other_block, other_keys) in list(in_flight.items()):
+                            if style == tax_style and other.cancel():
+                                in_flight.pop(other)
+                                for key in other_keys:
+                                    shared.release(key)
+                if on_merge is not None:
+                    on_merge()
+                submit(executor)
+    finally:
+        shared.free_all()
+
+
+
+def run_tax_style(
+    amm,
+    tax_function,
+    lp_initial_usdc,
+    lp_initial_dsd,
+    mu,
+    sigma,
+    nobs,
+    A=None,
+    num_iterations=50,
+    tolerance=None,
+    statistic='prices',
+    confidence=0.95,
+    batch_size=10,
+    record=(),
+    backend='serial',
+    absorbing=None,
+    adaptive=None,
+    slippage_surface=None,
+    seed=None,
+    workers=1,
+    cache=None,
+    store=None,
+):
+    """
+    Runs Monte Carlo paths for a single tax style and averages their histories.
+    Paths that failed are frozen at their last state and still averaged,
+    their failure statistics are reported under 'failures'.
+    Paths that reach an absorbing state (absorbing: dict of condition -> threshold,
+    see ABSORBING_CONDITIONS) stop being simulated, their last values are
+    carried forward and they are reported under 'absorptions'.
+
+    With tolerance=None exactly num_iterations paths are run.
+    Otherwise paths are run in batches of batch_size, stopping as soon as the
+    confidence interval half-width of the path statistic falls below tolerance,
+    with num_iterations as the upper limit on paths.
+
+    record: metrics for which every path's history is kept, e.g. ['prices']
+    seed, workers, cache, store: see run_configs()
+    """
+    config = dict(locals())
+    seed = config.pop('seed')
+    workers = config.pop('workers')
+    cache = config.pop('cache')
+    store = config.pop('store')
+    return run_configs(dict({ 'tax_style': config }), seed=seed, workers=workers, cache=cache, store=store)['tax_style']
+
+
+
+def run_tax_styles(tax_functions, seed=None, workers=1, cache=None, store=None, shared_pool=False, **kwargs):
+    """
+    Runs run_tax_style() for each tax style, in parallel with workers > 1.
+    tax_functions: dict of tax_style -> tax function (or "slippage")
+    shared_pool: step the tax styles' paths together, sharing the pool
+        until their sells diverge, see run_configs()
+    """
+    configs = dict({
+        tax_style: dict(kwargs, tax_function=tax_function)
+        for tax_style, tax_function in tax_functions.items()
+    })
+    return run_configs(configs, seed=seed, workers=workers, cache=cache, store=store, shared_pool=shared_pool)
+
+
+def show_convergence(results):
+    """prints how many paths each tax style needed"""
+    for tax_style, result in results.items():
+        print("{tax_style}:\t{num_paths:>5} paths\t{statistic} = {estimate:.6f} +/- {half_width:.6f}{note}".format(
+            tax_style = tax_style,
+            num_paths = result['num_paths'],
+            statistic = result['statistic'],
+            estimate = result['estimate'],
+            half_width = result['half_width'],
+            note = "\t(not converged)" if result['tolerance'] and not result['converged'] else "",
+        ))
+        for event in ['failures', 'absorptions']:
+            if result[event]['count'] > 0:
+                print("\t{event}: {count} paths, mean step: {mean_step:.1f}, reasons: {reasons}".format(
+                    event = event,
+                    **result[event]
+                ))
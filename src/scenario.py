@@ -0,0 +1,256 @@
+
+import argparse
+import copy
+import json
+import os
+
+from src import tax_functions
+from src.cache import ResultCache
+from src.results_store import ResultsStore
+from src.runner import run_configs, show_convergence
+from src.time_series_data import create_time_series_data_store
+
+
+# defaults for any key missing from a scenario spec
+SCENARIO_DEFAULTS = dict({
+    'amm': 'uniswap',
+    'lp_initial_usdc': 1_000_000,
+    'lp_initial_dsd': 10_000_000,
+    'A': None,
+    'trades': dict({
+        'mu': 0,
+        'sigma': 5000,
+        'nobs': 10000,
+        # price feedback traders, see simulate_path(), e.g.
+        # dict({ 'num_updates': 100, 'scale': 1000, 'mu_cap': 1000 })
+        'adaptive': None,
+    }),
+    'num_iterations': 50,
+    'tolerance': None,
+    'statistic': 'prices',
+    'batch_size': None,
+    'absorbing': None,
+    # look the slippage tax up in a precomputed table: SlippageSurface
+    # options, e.g. dict({ 'max_trade': 0.1, 'max_error': 1e-4 }), see src/slippage_surface.py
+    'slippage_surface': None,
+    # per-path histories to keep, e.g. for plotting each path
+    'record': ['prices'],
+    'seed': None,
+    'tax_styles': dict({}),
+    # parameter grid, see src/sweep.py
+    'sweep': dict({}),
+    'plot': dict({}),
+})
+
+# keys a tax style can override from the top level of the spec
+STYLE_KEYS = [
+    'amm',
+    'lp_initial_usdc',
+    'lp_initial_dsd',
+    'A',
+    'trades',
+    'num_iterations',
+    'tolerance',
+    'statistic',
+    'batch_size',
+    'absorbing',
+    'slippage_surface',
+    'record',
+]
+
+# ensembles beat stepping pools one at a time from about this many paths
+ENSEMBLE_MIN_PATHS = 10
+
+# paths per work unit. Large enough for ensembles to pay off, small enough
+# to spread a sweep over many workers. Each block has its own random stream,
+# so changing this (unlike the number of workers) changes the results.
+DEFAULT_BATCH_SIZE = 25
+
+
+
+def load_scenario(path):
+    """reads a JSON scenario spec, filling in defaults"""
+    with open(path) as f:
+        spec = json.load(f)
+    return create_scenario(spec)
+
+
+def create_scenario(spec):
+    """fills in defaults for a scenario spec (a dict)"""
+    scenario = copy.deepcopy(SCENARIO_DEFAULTS)
+    for key, value in spec.items():
+        if key == 'trades':
+            scenario['trades'].update(value)
+        else:
+            scenario[key] = copy.deepcopy(value)
+    return scenario
+
+
+def resolve_tax_function(name):
+    """looks up a tax function in src.tax_functions by name"""
+    if name == "slippage":
+        return name
+    return getattr(tax_functions, name)
+
+
+def tax_style_config(scenario, tax_style):
+    """settings for one tax style: the scenario's, overridden by the style's own"""
+    style = scenario['tax_styles'][tax_style]
+    config = dict({ key: copy.deepcopy(scenario[key]) for key in STYLE_KEYS })
+    for key, value in style.items():
+        if key == 'trades':
+            config['trades'] = dict(config['trades'], **value)
+        elif key in STYLE_KEYS:
+            config[key] = value
+    config['tax_function'] = resolve_tax_function(style.get('tax_function', tax_style))
+    if style.get('twap_window') is not None:
+        # taxed at the TWAP over the last twap_window trades
+        config['tax_function'] = tax_functions.twap_tax(config['tax_function'], style['twap_window'])
+    return config
+
+
+def choose_backend(config):
+    """
+    picks the fastest execution backend for a tax style:
+    ensembles for batches of paths with a fixed trade distribution,
+    otherwise stepping one pool at a time
+    """
+    if config['tax_function'] == "slippage":
+        return 'serial'
+    if tax_functions.uses_twap(config['tax_function']):
+        return 'serial'
+    if config['trades'].get('adaptive'):
+        return 'serial'
+    batch_size = min(config['batch_size'] or DEFAULT_BATCH_SIZE, config['num_iterations'])
+    if batch_size < ENSEMBLE_MIN_PATHS:
+        return 'serial'
+    return 'ensemble'
+
+
+
+def scenario_configs(scenario, backend='auto'):
+    """
+    run_configs() settings for every tax style of a scenario.
+    backend: 'auto' (see choose_backend()), 'serial' or 'ensemble'
+    """
+    configs = dict({})
+    for tax_style in scenario['tax_styles']:
+        config = tax_style_config(scenario, tax_style)
+        style_backend = choose_backend(config) if backend == 'auto' else backend
+
+        trades = config['trades']
+        configs[tax_style] = dict({
+            'amm': config['amm'],
+            'tax_function': config['tax_function'],
+            'lp_initial_usdc': config['lp_initial_usdc'],
+            'lp_initial_dsd': config['lp_initial_dsd'],
+            'mu': trades['mu'],
+            'sigma': trades['sigma'],
+            'nobs': trades['nobs'],
+            'A': config['A'],
+            'num_iterations': config['num_iterations'],
+            'tolerance': config['tolerance'],
+            'statistic': config['statistic'],
+            'batch_size': config['batch_size'] or DEFAULT_BATCH_SIZE,
+            'record': config['record'],
+            'backend': style_backend,
+            'absorbing': config['absorbing'],
+            'adaptive': trades.get('adaptive'),
+            'slippage_surface': config['slippage_surface'],
+        })
+    return configs
+
+
+def run_scenario(scenario, backend='auto', workers=1, cache=None, refresh=False, store=None):
+    """
+    Runs every tax style of a scenario.
+    backend: 'auto' (see choose_backend()), 'serial' or 'ensemble'
+    workers: number of processes to split (tax style, block of paths)
+        work units over, results are identical for any number of workers
+    cache: a ResultCache, tax styles of seeded scenarios that haven't
+        changed are loaded from it. refresh=True recomputes them anyway.
+    store: a ResultsStore for the recorded paths, see run_configs()
+    Returns dict of tax_style -> results, see run_tax_style()
+    """
+    return run_configs(
+        scenario_configs(scenario, backend),
+        seed=scenario['seed'],
+        workers=workers,
+        cache=cache,
+        refresh=refresh,
+        store=store,
+    )
+
+
+def scenario_colors(scenario):
+    """colour of each tax style, from the spec or the default data store colours"""
+    colors = create_time_series_data_store()['colors']
+    return dict({
+        tax_style: style.get('color', colors.get(tax_style, 'black'))
+        for tax_style, style in scenario['tax_styles'].items()
+    })
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a DSD DIP-14 sales tax simulation scenario"
+    )
+    parser.add_argument('spec', help="path to a JSON scenario spec, see scenarios/")
+    parser.add_argument('--backend', default='auto', choices=['auto', 'serial', 'ensemble'])
+    parser.add_argument('--iterations', type=int, help="overrides num_iterations")
+    parser.add_argument('--tolerance', type=float, help="overrides tolerance")
+    parser.add_argument('--seed', type=int, help="overrides seed")
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('--no-cache', action='store_true', help="don't load or store cached results")
+    parser.add_argument('--refresh', action='store_true', help="recompute cached results")
+    parser.add_argument('--clear-cache', action='store_true', help="empties the result cache first")
+    parser.add_argument('--store', help="directory to write recorded paths to, instead of memory")
+    parser.add_argument('--output', help="saves the figure to this file")
+    parser.add_argument('--show', action='store_true', help="shows the figure")
+    args = parser.parse_args(argv)
+
+    scenario = load_scenario(args.spec)
+    if args.iterations is not None:
+        scenario['num_iterations'] = args.iterations
+    if args.tolerance is not None:
+        scenario['tolerance'] = args.tolerance
+    if args.seed is not None:
+        scenario['seed'] = args.seed
+
+    cache = None if args.no_cache else ResultCache()
+    if cache is not None and args.clear_cache:
+        cache.clear()
+
+    store = None
+    if args.store:
+        store = ResultsStore(os.path.join(args.store, scenario.get('name', 'scenario')))
+
+    results = run_scenario(
+        scenario,
+        backend=args.backend,
+        workers=args.workers,
+        cache=cache,
+        refresh=args.refresh,
+        store=store,
+    )
+    show_convergence(results)
+
+    if args.show:
+        import matplotlib.pyplot as plt
+        from src.plotting import plot_scenario
+
+        fig, ax = plot_scenario(results, scenario)
+        if args.output:
+            fig.savefig(args.output, dpi=150)
+        plt.show()
+    elif args.output:
+        # headless, PNG or SVG by the file extension
+        from src.plotting import render_scenario
+        render_scenario(results, scenario, args.output)
+    return results
+
+
+
+if __name__=="__main__":
+    main()
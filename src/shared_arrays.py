@@ -0,0 +1,90 @@
+
+import numpy as np
+from multiprocessing import shared_memory
+
+
+
+def create_shared(shape, dtype='float64', values=None):
+    """
+    Allocates an array in shared memory.
+    Returns (shm, spec, array): spec is a small picklable dict workers pass
+    to attach_shared() to map the same memory, shm must be kept (and closed
+    and unlinked when done) for as long as the array is used.
+    """
+    dtype = np.dtype(dtype)
+    size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    if values is not None:
+        array[...] = values
+    spec = dict({ 'name': shm.name, 'shape': tuple(shape), 'dtype': dtype.str })
+    return shm, spec, array
+
+
+def attach_shared(spec):
+    """maps an array created by create_shared(), returns (shm, array) without copying"""
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    array = np.ndarray(spec['shape'], dtype=spec['dtype'], buffer=shm.buf)
+    return shm, array
+
+
+def release_shared(shm, unlink=False):
+    shm.close()
+    if unlink:
+        shm.unlink()
+
+
+
+class SharedArrays:
+    """
+    The parent process's shared arrays, by key, with a count of the work
+    units using each one. An array is freed when its last user releases it.
+    """
+
+    def __init__(self):
+        self.arrays = dict({})
+        self.users = dict({})
+
+
+    def __len__(self):
+        return len(self.arrays)
+
+
+    def __contains__(self, key):
+        return key in self.arrays
+
+
+    def create(self, key, shape, dtype='float64', values=None):
+        shm, spec, array = create_shared(shape, dtype, values)
+        self.arrays[key] = (shm, spec, array)
+        self.users[key] = 0
+        return spec
+
+
+    def acquire(self, key):
+        """spec of the array under key, counting one more user"""
+        self.users[key] += 1
+        return self.arrays[key][1]
+
+
+    def array(self, key):
+        return self.arrays[key][2]
+
+
+    def release(self, key):
+        """one user is done, frees the array once nobody uses it"""
+        self.users[key] -= 1
+        if self.users[key] <= 0:
+            self.free(key)
+
+
+    def free(self, key):
+        shm, spec, array = self.arrays.pop(key)
+        self.users.pop(key)
+        del array
+        release_shared(shm, unlink=True)
+
+
+    def free_all(self):
+        for key in list(self.arrays):
+            self.free(key)
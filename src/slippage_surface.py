@@ -0,0 +1,225 @@
+
+import math
+import numpy as np
+
+from src.curve_amm import get_D, get_D_batch, get_y, get_y_batch
+
+
+# grid of trade sizes (DSD sold / DSD balance) and balance ratios (USDC / DSD)
+DEFAULT_BOUNDS = dict({
+    'min_trade': 1e-6,
+    'max_trade': 1.0,
+    'min_ratio': 0.01,
+    'max_ratio': 10.0,
+})
+# about 1MB, and 0.1s to build for Curve
+DEFAULT_POINTS = dict({
+    'trade_points': 256,
+    'ratio_points': 512,
+})
+
+
+
+def exact_slippage(amm, dsd, balance_x, balance_y, A=None):
+    """
+    USDC received per DSD when selling dsd DSD untaxed into a pool with
+    balances (balance_x, balance_y), as sell_dsd_slippage_tax() measures it.
+    Takes arrays (broadcast together) or scalars.
+    """
+    dsd = np.asarray(dsd, dtype=float)
+    balance_x = np.asarray(balance_x, dtype=float)
+    balance_y = np.asarray(balance_y, dtype=float)
+    with np.errstate(all='ignore'):
+        if amm == 'curve':
+            D = get_D_batch([balance_x, balance_y], A)
+            after_balance_x = get_y_batch(1, 0, balance_y + dsd, [balance_x, balance_y], A, D=D)
+        else:
+            after_balance_x = balance_x * balance_y / (balance_y + dsd)
+        return np.abs(balance_x - after_balance_x) / dsd
+
+
+
+class SlippageSurface:
+    """
+    Slippage of untaxed DSD sales tabulated on a grid of trade size over
+    pool depth (dsd / balance_y) and balance ratio (balance_x / balance_y),
+    both log-spaced, for a Uniswap or Curve pool. A pool given a surface
+    (see create_pool()) looks its slippage tax up here instead of solving
+    a hypothetical sale before every real one.
+
+    Both invariants are homogeneous: scaling a pool's balances and the
+    trade scales the USDC it pays, so slippage depends on the two ratios
+    only. get_D()'s +1 guards break this slightly for Curve pools, so the
+    table is solved at the pool depth it will be used at.
+
+    Lookups are bilinear in (log trade, log ratio). Sales outside the grid
+    return None, and the pool solves them exactly.
+
+    max_error: largest absolute error allowed between the table and the
+        exact slippage, checked at the centre of every grid cell (where
+        bilinear interpolation is furthest from its corners) when building,
+        and at every check_every-th lookup. Exceeding it raises ValueError.
+    """
+
+    def __init__(self,
+        amm,
+        A=None,
+        depth=1.0,
+        min_trade=DEFAULT_BOUNDS['min_trade'],
+        max_trade=DEFAULT_BOUNDS['max_trade'],
+        min_ratio=DEFAULT_BOUNDS['min_ratio'],
+        max_ratio=DEFAULT_BOUNDS['max_ratio'],
+        trade_points=DEFAULT_POINTS['trade_points'],
+        ratio_points=DEFAULT_POINTS['ratio_points'],
+        max_error=None,
+        check_every=0,
+    ):
+        self.amm = amm
+        self.A = A
+        self.depth = depth
+        self.max_error = max_error
+        self.check_every = check_every
+        self.trades = np.geomspace(min_trade, max_trade, trade_points)
+        self.ratios = np.geomspace(min_ratio, max_ratio, ratio_points)
+        # grid in log space: first point and spacing
+        self.log_trade = (math.log(min_trade), math.log(max_trade / min_trade) / (trade_points - 1))
+        self.log_ratio = (math.log(min_ratio), math.log(max_ratio / min_ratio) / (ratio_points - 1))
+
+        # table[r, t]: slippage at ratio r and trade size t
+        self.table = exact_slippage(
+            amm,
+            (self.trades * depth)[None, :],
+            (self.ratios * depth)[:, None],
+            depth,
+            A,
+        )
+        assert np.all(np.isfinite(self.table)), "SlippageSurface: pools in the grid can't take the trades"
+        # nested lists are faster to index than arrays for one lookup at a time
+        self.rows = self.table.tolist()
+        self.lookups = 0
+        self.misses = 0
+        self.error = self.grid_error()
+        self.check(self.error)
+
+
+    def __repr__(self):
+        return "SlippageSurface(amm={}, A={}, depth={}, shape={}, error={:.2e})".format(
+            self.amm,
+            self.A,
+            self.depth,
+            self.table.shape,
+            self.error,
+        )
+
+
+    def __getstate__(self):
+        # the lists are rebuilt from the table
+        return dict({ key: value for key, value in self.__dict__.items() if key != 'rows' })
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rows = self.table.tolist()
+
+
+    def grid_error(self):
+        """largest absolute error of the table at the centres of its cells"""
+        trades = np.sqrt(self.trades[:-1] * self.trades[1:])
+        ratios = np.sqrt(self.ratios[:-1] * self.ratios[1:])
+        exact = exact_slippage(
+            self.amm,
+            (trades * self.depth)[None, :],
+            (ratios * self.depth)[:, None],
+            self.depth,
+            self.A,
+        )
+        # bilinear interpolation at a cell's centre is the mean of its corners
+        table = self.table
+        interpolated = (table[:-1, :-1] + table[:-1, 1:] + table[1:, :-1] + table[1:, 1:]) / 4
+        return float(np.max(np.abs(exact - interpolated)))
+
+
+    def check(self, error):
+        if self.max_error is not None and error > self.max_error:
+            raise ValueError(
+                "slippage surface error {:.2e} exceeds max_error {:.2e}, "
+                "use more points or narrower bounds".format(error, self.max_error)
+            )
+
+
+    def lookup(self, dsd, balance_x, balance_y):
+        """
+        slippage of selling dsd DSD into a pool with balances
+        (balance_x, balance_y), or None if that sale is outside the grid
+        """
+        self.lookups += 1
+        if dsd <= 0 or balance_x <= 0 or balance_y <= 0:
+            self.misses += 1
+            return None
+        t = (math.log(dsd / balance_y) - self.log_trade[0]) / self.log_trade[1]
+        r = (math.log(balance_x / balance_y) - self.log_ratio[0]) / self.log_ratio[1]
+        i, j = int(r), int(t)
+        if t < 0 or r < 0 or j >= len(self.trades) - 1 or i >= len(self.ratios) - 1:
+            # the last grid line itself is out too, simpler and just as cheap
+            self.misses += 1
+            return None
+        t -= j
+        r -= i
+        low, high = self.rows[i], self.rows[i + 1]
+        slippage = (
+            (1 - r) * ((1 - t) * low[j] + t * low[j + 1])
+            + r * ((1 - t) * high[j] + t * high[j + 1])
+        )
+
+        if self.check_every and self.lookups % self.check_every == 0:
+            self.check(abs(slippage - self.exact(dsd, balance_x, balance_y)))
+        return slippage
+
+
+    def exact(self, dsd, balance_x, balance_y):
+        """exact_slippage() of one sale, the way the pools solve it"""
+        if self.amm == 'curve':
+            xp = [balance_x, balance_y]
+            D = get_D(xp, self.A)
+            return abs(balance_x - get_y(1, 0, balance_y + dsd, xp, self.A, D)) / dsd
+        return abs(balance_x - balance_x * balance_y / (balance_y + dsd)) / dsd
+
+
+    def slippage(self, dsd, balance_x, balance_y):
+        """lookup() over arrays of sales (broadcast together), nan outside the grid"""
+        dsd, balance_x, balance_y = np.broadcast_arrays(
+            np.asarray(dsd, dtype=float),
+            np.asarray(balance_x, dtype=float),
+            np.asarray(balance_y, dtype=float),
+        )
+        with np.errstate(all='ignore'):
+            t = (np.log(dsd / balance_y) - self.log_trade[0]) / self.log_trade[1]
+            r = (np.log(balance_x / balance_y) - self.log_ratio[0]) / self.log_ratio[1]
+        inside = (t >= 0) & (r >= 0) & (t < len(self.trades) - 1) & (r < len(self.ratios) - 1)
+        j = np.where(inside, t, 0).astype(np.int64)
+        i = np.where(inside, r, 0).astype(np.int64)
+        t = t - j
+        r = r - i
+        table = self.table
+        slippage = (
+            (1 - r) * ((1 - t) * table[i, j] + t * table[i, j + 1])
+            + r * ((1 - t) * table[i + 1, j] + t * table[i + 1, j + 1])
+        )
+        return np.where(inside, slippage, np.nan)
+
+
+
+# surfaces built in this process, see surface_for()
+_surfaces = dict({})
+
+
+def surface_for(amm, A=None, depth=1.0, **options):
+    """
+    the SlippageSurface of a pool, built once per process and shared by
+    every path with the same settings.
+    options: SlippageSurface keywords, e.g. dict({ 'max_trade': 0.1, 'max_error': 1e-4 })
+    """
+    key = (amm, A, depth, tuple(sorted(options.items())))
+    if key not in _surfaces:
+        _surfaces[key] = SlippageSurface(amm, A, depth, **options)
+    return _surfaces[key]
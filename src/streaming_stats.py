@@ -0,0 +1,83 @@
+
+import numpy as np
+from statistics import NormalDist
+
+
+
+class RunningStats:
+    """
+    Streaming mean and variance (Welford's algorithm)
+    over scalars or whole time series, one path at a time.
+    Two RunningStats can be merged (Chan et al.), so batches
+    can be accumulated separately and combined afterwards.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+
+    def __repr__(self):
+        return "RunningStats(count={}, mean={})".format(self.count, self.mean)
+
+
+    def push(self, value):
+        """adds a single observation (a scalar, or a time series)"""
+        value = np.asarray(value, dtype=float)
+        if self.count == 0:
+            self.count = 1
+            self.mean = value.copy()
+            self.m2 = np.zeros_like(value)
+            return self
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.count
+        self.m2 = self.m2 + delta * (value - self.mean)
+        return self
+
+
+    def merge(self, other):
+        """combines the observations of another RunningStats into this one"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count = other.count
+            self.mean = np.copy(other.mean)
+            self.m2 = np.copy(other.m2)
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + delta**2 * (self.count * other.count / count)
+        self.count = count
+        return self
+
+
+    @property
+    def variance(self):
+        """sample variance (ddof=1)"""
+        if self.count < 2:
+            return np.full_like(self.mean, np.inf)
+        return self.m2 / (self.count - 1)
+
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+    def half_width(self, confidence=0.95):
+        """half-width of the normal confidence interval for the mean"""
+        return confidence_half_width(self.std, self.count, confidence)
+
+
+
+def confidence_half_width(std, count, confidence=0.95):
+    """z * std / sqrt(n), the half-width of a normal confidence interval"""
+    if count < 2:
+        return np.inf
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    return z * std / np.sqrt(count)
@@ -0,0 +1,144 @@
+
+import argparse
+import copy
+import itertools
+import os
+import pickle
+
+from src.cache import ResultCache
+from src.checkpoint import Checkpoint, DEFAULT_INTERVAL
+from src.results_store import ResultsStore
+from src.runner import resume_configs, run_configs
+from src.scenario import load_scenario, scenario_configs
+
+
+
+def sweep_variants(scenario):
+    """
+    Expands scenario['sweep'], a dict of setting -> list of values, into one
+    scenario per combination of values. Settings are any top-level key of the
+    spec, or 'trades.<key>' for the trade distribution, e.g.
+        "sweep": { "A": [10, 100], "lp_initial_usdc": [1000000, 11000000] }
+    Tax schedules are swept by listing them as tax styles.
+    Returns dict of variant name -> scenario
+    """
+    sweep = scenario['sweep']
+    variants = dict({})
+    for values in itertools.product(*sweep.values()):
+        variant = copy.deepcopy(scenario)
+        variant['sweep'] = dict({})
+        for setting, value in zip(sweep.keys(), values):
+            if setting.startswith('trades.'):
+                variant['trades'][setting[len('trades.'):]] = value
+            else:
+                variant[setting] = value
+        name = " ".join(
+            "{}={}".format(setting, value) for setting, value in zip(sweep.keys(), values)
+        )
+        variants[name] = variant
+    return variants
+
+
+def group_results(results):
+    """dict of (variant, tax_style) -> results to dict of variant -> tax_style -> results"""
+    grouped = dict({})
+    for (variant, tax_style), result in results.items():
+        grouped.setdefault(variant, dict({}))[tax_style] = result
+    return grouped
+
+
+def run_sweep(scenario, backend='auto', workers=1, cache=None, checkpoint=None, store=None):
+    """
+    Runs every tax style of every variant of a scenario (see sweep_variants())
+    as a single run, so work units of all variants share the workers.
+    checkpoint: a Checkpoint, see resume_sweep()
+    store: a ResultsStore, each variant's paths go under <variant>/<tax_style>
+    Returns dict of variant -> tax_style -> results
+    """
+    configs = dict({})
+    for variant, variant_scenario in sweep_variants(scenario).items():
+        print('Variant: {}'.format(variant))
+        for tax_style, config in scenario_configs(variant_scenario, backend).items():
+            configs[(variant, tax_style)] = config
+
+    results = run_configs(
+        configs,
+        seed=scenario['seed'],
+        workers=workers,
+        cache=cache,
+        checkpoint=checkpoint,
+        store=store,
+    )
+    return group_results(results)
+
+
+def resume_sweep(checkpoint, workers=1, cache=None):
+    """continues run_sweep() from its checkpoint, giving the same results"""
+    return group_results(resume_configs(checkpoint, workers=workers, cache=cache))
+
+
+def show_sweep(results):
+    """prints the path statistic of each tax style for every variant"""
+    for variant, variant_results in results.items():
+        print(variant)
+        for tax_style, result in variant_results.items():
+            print("\t{tax_style}:\t{num_paths:>5} paths\t{statistic} = {estimate:.6f} +/- {half_width:.6f}".format(
+                tax_style = tax_style,
+                **result
+            ))
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a parameter sweep over a scenario, with checkpoints"
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="starts a sweep")
+    run.add_argument('spec', help="path to a JSON scenario spec with a 'sweep' grid")
+    run.add_argument('--backend', default='auto', choices=['auto', 'serial', 'ensemble'])
+    run.add_argument('--iterations', type=int, help="overrides num_iterations")
+    run.add_argument('--seed', type=int, help="overrides seed")
+    run.add_argument('--checkpoint', help="checkpoint file, defaults to <spec name>.ckpt")
+    run.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="seconds between checkpoints")
+    run.add_argument('--store', help="directory to write recorded paths to, instead of memory")
+
+    resume = commands.add_parser('resume', help="continues a sweep from its checkpoint")
+    resume.add_argument('checkpoint', help="checkpoint file written by 'run'")
+
+    for command in [run, resume]:
+        command.add_argument('--workers', type=int, default=1, help="number of worker processes")
+        command.add_argument('--no-cache', action='store_true', help="don't load or store cached results")
+        command.add_argument('--output', help="pickles the results to this file")
+    args = parser.parse_args(argv)
+
+    cache = None if args.no_cache else ResultCache()
+    if args.command == 'run':
+        scenario = load_scenario(args.spec)
+        if args.iterations is not None:
+            scenario['num_iterations'] = args.iterations
+        if args.seed is not None:
+            scenario['seed'] = args.seed
+        path = args.checkpoint or "{}.ckpt".format(os.path.splitext(os.path.basename(args.spec))[0])
+        results = run_sweep(
+            scenario,
+            backend=args.backend,
+            workers=args.workers,
+            cache=cache,
+            checkpoint=Checkpoint(path, args.interval),
+            store=ResultsStore(args.store) if args.store else None,
+        )
+    else:
+        results = resume_sweep(Checkpoint(args.checkpoint), workers=args.workers, cache=cache)
+
+    show_sweep(results)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            pickle.dump(results, f)
+    return results
+
+
+
+if __name__=="__main__":
+    main()
@@ -1,14 +1,12 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
 
 def quadratic_tax(price, dsd_amount):
     # tax is only in-effet under the peg
-    if price > 1:
-        return 0
+    # np.minimum instead of an if-statement so price can be an array of paths
+    distance_from_peg = 1 - np.minimum(price, 1)
 
-    tax = (1 - price)**2 * np.abs(dsd_amount)
-    assert tax <= dsd_amount
+    tax = distance_from_peg**2 * np.abs(dsd_amount)
+    assert np.all(tax <= np.abs(dsd_amount)), "quadratic_tax: tax exceeds amount sold"
     return tax
 
 def logistic_tax(price, dsd_amount):
@@ -32,8 +30,35 @@ def log_tax(price, dsd_amount):
 def cubic_tax(price, dsd_amount):
     return ((1 + (1 - price)**2)**1/3 - 1/3) * np.abs(dsd_amount)
 
+class TwapTax:
+    """
+    A tax function taxing at the pool's time-weighted average price over
+    the last twap_window (steps, or time units of the pool's TWAP clock)
+    instead of its spot price. Pools running it track their TWAP, see
+    Curve.track_twap().
+    """
+
+    def __init__(self, tax_function, twap_window):
+        self.tax_function = tax_function
+        self.twap_window = twap_window
+
+    def __repr__(self):
+        return "twap_tax({}, {})".format(getattr(self.tax_function, '__name__', self.tax_function), self.twap_window)
+
+    def __call__(self, price, dsd_amount):
+        return self.tax_function(price, dsd_amount)
+
+def twap_tax(tax_function, twap_window):
+    """e.g. twap_tax(quadratic_tax, 100): quadratic_tax at the 100 step TWAP"""
+    return TwapTax(tax_function, twap_window)
+
+def uses_twap(tax_function):
+    return getattr(tax_function, 'twap_window', None) is not None
+
 
 if __name__=="__main__":
+    import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
 
     fig, ax = plt.subplots()
 
@@ -0,0 +1,124 @@
+
+import bisect
+
+from src.history import fork_history
+
+
+class TwapAccumulator:
+    """
+    A Uniswap v2 style cumulative price: each price observed is weighted by
+    how long it held, so the time-weighted average price over any past
+    window is a difference of two cumulative values.
+
+    clock: a callable returning the current time, e.g. lambda: scheduler.now
+        (see src/events.py). By default time is the pool's step count: price
+        k of history['prices'] holds from step k to k + 1, and finding a
+        time's cumulative value is an index rather than a search.
+
+    The series are only appended to, like a pool's history, so snapshots
+    are their length and forks share them, see Curve.fork().
+    """
+
+    def __init__(self, price, clock=None, time=None, series=None):
+        self.clock = clock
+        if series is None:
+            time = (0 if clock is None else clock()) if time is None else time
+            series = dict({
+                'times': [time],
+                # cumulative price at each time, before that time's price
+                'cumulative': [0.0],
+                'prices': [price],
+            })
+        self.series = series
+
+
+    def __repr__(self):
+        return "TwapAccumulator(observations={}, now={})".format(len(self.series['times']), self.now())
+
+
+    def now(self):
+        if self.clock is None:
+            # the step the next price will be observed at, one after the last
+            return self.series['times'][-1] + 1
+        return self.clock()
+
+
+    def update(self, price, time=None):
+        """observes the price the pool has from time on (by default now())"""
+        time = self.now() if time is None else time
+        series = self.series
+        series['cumulative'].append(series['cumulative'][-1] + series['prices'][-1] * (time - series['times'][-1]))
+        series['times'].append(time)
+        series['prices'].append(price)
+
+
+    def cumulative(self, time):
+        """the cumulative price at time, from the first observation on"""
+        series = self.series
+        times = series['times']
+        if time >= times[-1]:
+            # since the last observation, e.g. now
+            return series['cumulative'][-1] + series['prices'][-1] * (time - times[-1])
+        if self.clock is None and time == int(time):
+            # step clock: observation k is at step k from the first, unless
+            # some were observed at explicit times
+            k = int(time) - int(times[0])
+            if 0 <= k < len(times) and times[k] == time:
+                return series['cumulative'][k]
+        k = bisect.bisect_right(times, time) - 1
+        if k < 0:
+            raise ValueError("no price observed by time {}".format(time))
+        return series['cumulative'][k] + series['prices'][k] * (time - times[k])
+
+
+    def twap(self, window, now=None):
+        """
+        time-weighted average price over the window up to now (by default
+        now()), or since the first observation if the window is longer
+        """
+        now = self.now() if now is None else now
+        start = max(now - window, self.series['times'][0])
+        return self.twap_between(start, now)
+
+
+    def twap_between(self, start, stop):
+        """time-weighted average price from time start to time stop"""
+        if stop <= start:
+            # an empty window: the price at that time
+            return self.price_at(start)
+        return (self.cumulative(stop) - self.cumulative(start)) / (stop - start)
+
+
+    def price_at(self, time):
+        """the price that held at time"""
+        k = bisect.bisect_right(self.series['times'], time) - 1
+        return self.series['prices'][max(k, 0)]
+
+
+    def snapshot(self):
+        return len(self.series['times'])
+
+
+    def restore(self, snapshot):
+        for series in self.series.values():
+            del series[snapshot:]
+
+
+    def fork(self):
+        """a copy sharing the observations so far, see fork_history()"""
+        return TwapAccumulator(None, self.clock, series=fork_history(self.series))
+
+
+
+def tax_price(pool, tax_function, price=None):
+    """
+    the price a tax function taxes at: its TWAP for taxes made with
+    twap_tax() (see src/tax_functions.py), the spot price otherwise
+    (price, or by default pool.price_oracle(), only solved when needed)
+    """
+    window = getattr(tax_function, 'twap_window', None)
+    if window is None:
+        return pool.price_oracle() if price is None else price
+    if pool.twap is None:
+        raise ValueError("{} needs the pool to track its TWAP, see track_twap()".format(tax_function))
+    return pool.twap.twap(window)
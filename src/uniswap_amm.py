@@ -1,10 +1,11 @@
 
+import copy
 import numpy as np
-import pandas as pd
-# plots
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-import mplfinance as fplt
+
+# plotting libraries are imported inside the plotting functions, see src/ohlc.py
+from src.history import fork_history
+from src.twap import TwapAccumulator, tax_price
+from src.ohlc import OnlineCandles, candles, plot_candles
 
 
 
@@ -12,12 +13,30 @@ import mplfinance as fplt
 class Uniswap:
     "This is a Uniswap AMM"
 
+    __slots__ = [
+        'balance_x',
+        'balance_y',
+        'x_name',
+        'y_name',
+        'k',
+        'history',
+        'ohlc',
+        'live_candles',
+        'treasury_tax_rate',
+        'failure',
+        'slippage_surface',
+        'twap',
+    ]
+    # what snapshot() keeps, besides how long the history series are
+    state_names = ['balance_x', 'balance_y', 'failure']
+
     def __init__(self,
         x=1200,
         y=400,
         x_name="USDC",
         y_name="DSD",
-        treasury_tax_rate=0.5
+        treasury_tax_rate=0.5,
+        history=None,
     ):
         # x, y are initial balances
         self.balance_x = x
@@ -27,16 +46,30 @@ class Uniswap:
         self.k = x * y # invariant
         # for more on how AMMs work:
         # https://uniswap.org/docs/v2/protocol-overview/how-uniswap-works/
-        self.history = dict({
-            # history of treasury balances over time
-            'treasury_balances': [0],
-            # history of prices
-            'prices': [self.price_oracle()], # initial price
-            # history of burns over time
-            'burns': [0],
-        })
+        # lists, or e.g. spilled_history() for very long runs
+        if history is None:
+            history = dict({
+                # history of treasury balances over time
+                'treasury_balances': [],
+                # history of prices
+                'prices': [],
+                # history of burns over time
+                'burns': [],
+            })
+        self.history = history
+        self.history['treasury_balances'].append(0)
+        self.history['prices'].append(self.price_oracle()) # initial price
+        self.history['burns'].append(0)
         self.ohlc = None
+        # OnlineCandles, see track_candles()
+        self.live_candles = None
         self.treasury_tax_rate=0.5
+        # set by swap() when a trade fails: dict({ 'step', 'reason' })
+        self.failure = None
+        # SlippageSurface to look the slippage tax up in, see src/slippage_surface.py
+        self.slippage_surface = None
+        # TwapAccumulator, see track_twap()
+        self.twap = None
 
 
     def __repr__(self):
@@ -60,36 +93,45 @@ class Uniswap:
 
 
     def ohlc_generate_prices(self, num_sections=10):
-        # split history['prices'] into arrays [[], []]
-        ts_prices = np.array_split(self.history['prices'], num_sections)
-        dates = pd.date_range(start='1/1/2021', periods=len(ts_prices))
-        ohlc_timeseries = []
-
-        for i, ts in enumerate(ts_prices):
-            ohlc_timeseries.append(dict({
-                'Date': dates[i],
-                'Open': ts[0],
-                'High': np.max(ts),
-                'Low': np.min(ts),
-                'Close': ts[-1],
-            }))
-        # dates = pd.date_range(start='1/1/2021', end='1/2/2021', periods=1000)
-        ohlc_df = pd.DataFrame(ohlc_timeseries)
-        self.ohlc = ohlc_df.set_index("Date")
+        """
+        num_sections open/high/low/close candles of history['prices'],
+        or the candles built while trading if track_candles() was called
+        and num_sections is None. See src/ohlc.py
+        """
+        if num_sections is None and self.live_candles is not None:
+            self.ohlc = self.live_candles.candles()
+        else:
+            self.ohlc = candles(self.history['prices'], num_sections)
         return self.ohlc
 
 
     def ohlc_plot(self, num_sections=10):
         self.ohlc_generate_prices(num_sections)
-        fplt.plot(
+        return plot_candles(
             self.ohlc,
-            type='candle',
-            style='yahoo',
             title='DSD, simulated trades',
-            ylabel='Price DSD/USDC'
+            ylabel='Price DSD/USDC',
         )
 
 
+    def track_candles(self, bucket_size):
+        """builds candles of bucket_size prices while trading, see OnlineCandles"""
+        self.live_candles = OnlineCandles(bucket_size)
+        # starting from the current price
+        self.live_candles.update(self.history['prices'][-1])
+        return self.live_candles
+
+
+    def track_twap(self, clock=None):
+        """
+        keeps a cumulative price while the pool trades, for TWAP queries and
+        TWAP taxes (see twap_tax()). By default time is the pool's step count,
+        clock: a callable returning the current time, e.g. lambda: scheduler.now
+        """
+        self.twap = TwapAccumulator(self.history['prices'][-1], clock)
+        return self.twap
+
+
     def show_balances(self):
         print("{} balance:\t{}".format(self.x_name, self.balance_x))
         print("{} balance:\t{}".format(self.y_name, self.balance_y))
@@ -107,24 +149,179 @@ class Uniswap:
         return self.balance_x / self.balance_y
 
 
+    def snapshot(self):
+        """
+        the pool's state, to restore() after trying trades out: its balances,
+        failure, candles and how long each history series is (histories are
+        only appended to, so restore() truncates them)
+        """
+        return (
+            tuple(getattr(self, name) for name in self.state_names),
+            dict({ metric: len(series) for metric, series in self.history.items() }),
+            None if self.live_candles is None else self.live_candles.snapshot(),
+            None if self.twap is None else self.twap.snapshot(),
+        )
+
+
+    def restore(self, snapshot):
+        """goes back to the state of snapshot(), taken from this pool"""
+        state, lengths, candles, twap = snapshot
+        for name, value in zip(self.state_names, state):
+            setattr(self, name, value)
+        for metric, length in lengths.items():
+            del self.history[metric][length:]
+        if candles is not None:
+            self.live_candles.restore(candles)
+        if twap is not None:
+            self.twap.restore(twap)
+
+
+    def fork(self):
+        """
+        a copy of the pool to try trades out on, or to build many pools from
+        one template. Its history shares every value so far with this pool's,
+        copy-on-write (see fork_history()), so forking a pool costs the same
+        however long it has traded
+        """
+        pool = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(pool, name, getattr(self, name))
+        pool.history = fork_history(self.history)
+        pool.live_candles = copy.deepcopy(self.live_candles)
+        pool.twap = None if self.twap is None else self.twap.fork()
+        pool.ohlc = None
+        return pool
+
+
+    def quote_sell(self, amounts):
+        """
+        What selling each of amounts DSD into the pool would do, without
+        trading: the pool and its history are left alone. Untaxed, like
+        sell_dsd() with no tax_function, with the same results.
+        Returns dict of arrays, one element per amount:
+        'amount_out' USDC received, 'balance_x'/'balance_y' after the trade,
+        'price' after the trade and 'slippage' USDC received per DSD sold,
+        as sell_dsd_slippage_tax() measures it.
+        """
+        dsd = np.abs(np.asarray(amounts, dtype=float))
+        after_balance_y = self.balance_y + dsd
+        return self.quote(self.k / after_balance_y, after_balance_y)
+
+
+    def quote_buy(self, amounts):
+        """
+        What buying each of amounts DSD from the pool would do, without
+        trading, like buy_dsd(). Returns the dict of quote_sell(), with
+        'amount_in': USDC paid, in place of 'amount_out'.
+        Trades draining the pool are nan.
+        """
+        dsd = np.abs(np.asarray(amounts, dtype=float))
+        after_balance_y = np.where(self.balance_y - dsd > 0, self.balance_y - dsd, np.nan)
+        quote = self.quote(self.k / after_balance_y, after_balance_y)
+        quote['amount_in'] = -quote.pop('amount_out')
+        return quote
+
+
+    def quote(self, after_balance_x, after_balance_y):
+        """quote_sell()/quote_buy() results for the balances after each trade"""
+        with np.errstate(all='ignore'):
+            slippage = np.abs(
+                (self.balance_x - after_balance_x) / (self.balance_y - after_balance_y)
+            )
+        # no trade: the slippage of a vanishing trade is the price
+        slippage = np.where(after_balance_y == self.balance_y, self.price_oracle(), slippage)
+        return dict({
+            'amount_out': self.balance_x - after_balance_x,
+            'balance_x': after_balance_x,
+            'balance_y': after_balance_y,
+            'price': after_balance_x / after_balance_y,
+            'slippage': slippage,
+        })
+
+
     def swap(self, trade, tax_function):
         """
         trade: dict({ 'type': 'sell'|'buy', amount: float })
-        """
 
-        if trade['type'] == 'buy':
-            price_after = self.buy_dsd(trade['amount'])
-        else:
-            if tax_function == "slippage":
-                price_after = self.sell_dsd_slippage_tax(trade['amount'])
+        If a trade breaks the pool (e.g. drains one side), the path is
+        flagged in self.failure and its state is frozen: this and all
+        later swaps leave the balances alone and repeat the last values.
+        """
+        if self.failure is not None:
+            return self.carry_forward()
+
+        prior_balances = (self.balance_x, self.balance_y)
+        num_steps = len(self.history['prices'])
+        observed = None if self.twap is None else self.twap.snapshot()
+        try:
+            if trade['type'] == 'buy':
+                price_after = self.buy_dsd(trade['amount'])
             else:
-                price_after = self.sell_dsd(trade['amount'], tax_function)
-
+                if tax_function == "slippage":
+                    price_after = self.sell_dsd_slippage_tax(trade['amount'])
+                else:
+                    price_after = self.sell_dsd(trade['amount'], tax_function)
+        except (AssertionError, ZeroDivisionError) as e:
+            # undo the failed trade, then freeze the path
+            self.balance_x, self.balance_y = prior_balances
+            for series in self.history.values():
+                del series[num_steps:]
+            if self.twap is not None:
+                self.twap.restore(observed)
+            self.failure = dict({
+                'step': num_steps - 1, # index of the failed trade
+                'reason': str(e) or type(e).__name__,
+            })
+            return self.carry_forward()
+
+        if self.live_candles is not None:
+            self.live_candles.update(price_after)
         # self.show_balances()
         # self.show_price()
         return price_after
 
 
+    def trade_net(self, dsd_amount, burn=0):
+        """
+        Moves dsd_amount DSD into the pool (out of it if negative) in one
+        trade, e.g. a block's sales net of its buys and burns, and records
+        burn DSD burnt by taxes on the way, see src/blocks.py
+        """
+        after_balance_y = self.balance_y + dsd_amount
+        assert after_balance_y > 0, "trade_net: not enough DSD in the pool"
+        after_balance_x = uniswap_x(after_balance_y, self.k)
+        self.balance_y = after_balance_y
+        self.balance_x = after_balance_x
+        after_price = self.price_oracle()
+
+        # fraction of burnt dsd, to treasury, say 50%
+        burn_to_treasury = self.treasury_tax_rate * burn
+        actual_burn = (1 - self.treasury_tax_rate) * burn
+
+        self.history['treasury_balances'].append(
+            self.history['treasury_balances'][-1] + burn_to_treasury
+        )
+        self.history['prices'].append(after_price)
+        self.history['burns'].append(actual_burn)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
+        return after_price
+
+
+    def carry_forward(self):
+        """records a step where nothing happens, e.g. on a frozen path"""
+        self.history['treasury_balances'].append(
+            self.history['treasury_balances'][-1]
+        )
+        self.history['prices'].append(self.history['prices'][-1])
+        self.history['burns'].append(0)
+        if self.live_candles is not None:
+            self.live_candles.update(self.history['prices'][-1])
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
+        return self.history['prices'][-1]
+
+
     def buy_dsd_with_usdc(self, usdc_amount):
         """Buys usdc_amount worth of DSD
         Denominated in USDC
@@ -140,6 +337,8 @@ class Uniswap:
         ) # no change to treasury on buys
         self.history['prices'].append(self.price_oracle())
         self.history['burns'].append(0)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
         return self.price_oracle()
 
 
@@ -148,6 +347,7 @@ class Uniswap:
         no taxes for buys"""
 
         new_y = self.balance_y - dsd_amount
+        assert new_y > 0, "buy_dsd: not enough DSD in the pool"
         x = uniswap_x(new_y, self.k)
         self.balance_x = x
         self.balance_y = new_y
@@ -157,6 +357,8 @@ class Uniswap:
         ) # no change to treasury on buys
         self.history['prices'].append(self.price_oracle())
         self.history['burns'].append(0) # no burns on buys
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
         return self.price_oracle()
 
 
@@ -172,7 +374,8 @@ class Uniswap:
 
         prior_balance_x = self.balance_x
         prior_balance_y = self.balance_y
-        prior_price = self.price_oracle()
+        # spot price, or the TWAP for TWAP taxes, see src/twap.py
+        prior_price = tax_price(self, tax_function)
 
         # Calculate DSD burn before updating balances
         # Or after? After might be better as it takes into account the size of the sell order (slippage)
@@ -183,7 +386,7 @@ class Uniswap:
 
         # actual amount sold into LP pool after burn
         leftover_dsd = np.abs(dsd_amount) - burn
-        assert leftover_dsd >= 0
+        assert leftover_dsd >= 0, "tax exceeds amount sold"
 
         # print('leftover_dsd:', leftover_dsd)
         # print('self.balance_y:', self.balance_y + leftover_dsd)
@@ -205,6 +408,8 @@ class Uniswap:
         )
         self.history['prices'].append(after_price)
         self.history['burns'].append(actual_burn)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
 
         return self.price_oracle()
 
@@ -222,24 +427,29 @@ class Uniswap:
         prior_balance_y = self.balance_y
         prior_price = self.price_oracle()
 
-        # balance_y (DSD) increases when DSD is sold to pool
-        after_balance_x = uniswap_x(
-            prior_balance_y + dsd,
-            self.k
-        )
-        after_balance_y = self.balance_y + dsd
-
-        # calculate slippage + burn first, before swap
-        slippage = dydx_once(
-            x2 = after_balance_y,
-            x1 = prior_balance_y,
-            y2 = after_balance_x,
-            y1 = prior_balance_x,
-        )
+        slippage = None
+        if self.slippage_surface is not None:
+            slippage = self.slippage_surface.lookup(dsd, prior_balance_x, prior_balance_y)
+
+        if slippage is None:
+            # balance_y (DSD) increases when DSD is sold to pool
+            after_balance_x = uniswap_x(
+                prior_balance_y + dsd,
+                self.k
+            )
+            after_balance_y = self.balance_y + dsd
+
+            # calculate slippage + burn first, before swap
+            slippage = dydx_once(
+                x2 = after_balance_y,
+                x1 = prior_balance_y,
+                y2 = after_balance_x,
+                y1 = prior_balance_x,
+            )
         burn =  (1 - np.abs(slippage)) * dsd if (np.abs(slippage) < 1) else 0
         # print("burn: {}".format(1 - slippage))
         # print("price: {}".format(prior_price))
-        print("slippage: {}".format(slippage))
+        # print("slippage: {}".format(slippage))
 
         # actual amount sold into LP pool after burn
         leftover_dsd = dsd - burn
@@ -249,6 +459,7 @@ class Uniswap:
             prior_balance_y + leftover_dsd,
             self.k
         )
+        after_balance_y = prior_balance_y + leftover_dsd
 
         # now update balances adjusting for burn
         self.balance_y = after_balance_y
@@ -264,6 +475,8 @@ class Uniswap:
         )
         self.history['prices'].append(after_price)
         self.history['burns'].append(actual_burn)
+        if self.twap is not None:
+            self.twap.update(self.history['prices'][-1])
 
         return self.price_oracle()
 
@@ -276,8 +489,8 @@ class Uniswap:
 
 def uniswap_y(x, k=250):
     y = k/x
-    assert not np.isnan(y)
-    assert y >= 0
+    assert not np.any(np.isnan(y)), "uniswap_y: balance is nan"
+    assert np.all(y >= 0), "uniswap_y: negative balance"
     return y
 
 
@@ -286,18 +499,18 @@ def uniswap_x(y, k=250):
     if np.isnan(x):
         print('x: ', x)
         print('y: ', y)
-    assert not np.isnan(x)
+    assert not np.isnan(x), "uniswap_x: balance is nan"
     if (x < 0):
         print('x: ', x)
         print('y: ', y)
-    assert x >= 0
+    assert x >= 0, "uniswap_x: negative balance"
     return x
 
 
 def linear_y(x, k=250):
     y = k - x
-    assert not np.isnan(y)
-    assert y >= 0
+    assert not np.any(np.isnan(y))
+    assert np.all(y >= 0)
     return y
 
 
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
-from src.curve_amm import get_y, stableswap_y, get_D, stableswap_x
+from src.curve_amm import get_D_batch, trace_stableswap
 from src.uniswap_amm import uniswap_y, uniswap_x, linear_y
 
 #######################################
@@ -22,13 +22,13 @@ from src.uniswap_amm import uniswap_y, uniswap_x, linear_y
 
 def find_peg_point(x1: list[float], y1: list[float]) -> int:
     """find index where x - y is smallest, which is where balances of x-coins and y-coins in the LP pool are equal"""
-    return np.argmin([np.abs(x - y) for x,y in zip(x1, y1)])
+    return np.argmin(np.abs(np.asarray(x1) - np.asarray(y1)))
 
 
 def dydx_array(yy: list[float], xx: list[float], absolute=True) -> list[float]:
     """calculates an array of derivatives"""
     assert len(xx) == len(yy)
-    dydx_array: list[float] = np.abs(np.diff(yy)/np.diff(xx))
+    dydx_array: list[float] = np.diff(yy)/np.diff(xx)
     return np.abs(dydx_array) if absolute else dydx_array
 
 
@@ -41,16 +41,16 @@ def plot_fig1():
     ##### Fig. 1 In Stableswap whitepaper
     # Uniswap constant-product invariant
     x1 = np.linspace(0.01, 30, NUM_OBS)
-    y1 = [uniswap_y(x, 25) for x in x1]
+    y1 = uniswap_y(x1, 25)
 
     # linear constant-sum invariant
     x2 = np.linspace(0.01, 10, NUM_OBS)
-    y2 = [linear_y(x, 10) for x in x2]
+    y2 = linear_y(x2, 10)
 
     # Curve Stableswap invariant
     x3 = np.linspace(0.01, 30, NUM_OBS)
     xp = [5,5]
-    y3 = [stableswap_y(x, xp, 20) for x in x3]
+    y3 = trace_stableswap(x3, xp, 20)['y']
 
     # Create the plots
     plt.figure(figsize=[4.75,3])
@@ -74,22 +74,22 @@ def plot_fig2():
 
     ## Uniswap plot data
     x1 = np.linspace(0.01, 30, NUM_OBS)
-    y1 = [uniswap_y(x, 196) for x in x1]
+    y1 = uniswap_y(x1, 196)
     # Get derivatives of the curve to plot
     dydx1 = dydx_array(y1, x1)
     peg_index1 = find_peg_point(x1, y1)
     # shifts graph to past peg point
-    dx1 = [x-14 for x in x1]
+    dx1 = x1 - 14
 
 
     ## Curve plot data
     peg_point: int = 240
 
     x3 = np.linspace(0.001, 2000+peg_point, NUM_OBS*10)
-    dx3 = [x-peg_point for x in x3]
-    y3 = [stableswap_y(x, [700,400], 100) for x in x3]
+    dx3 = x3 - peg_point
+    y3 = trace_stableswap(x3, [700,400], 100)['y']
     peg_index3: int = find_peg_point(x3, y3)
-    dydx3 = [get_D([y,x], 100) / (x+y) for x,y in zip(x3, y3)]
+    dydx3 = get_D_batch([y3, x3], 100) / (x3 + y3)
 
     ## Create plots
     fig, ax = plt.subplots(figsize=[6,4])
@@ -119,11 +119,11 @@ def plot_fig2():
     percentage_bonded = 0.12
     # sales tax based on percentage DAO bonded
     # i.e a "global" coordination game
-    slippageDx3 = [(1-x)*(1-percentage_bonded)  for x in dydx3]
+    slippageDx3 = (1-dydx3)*(1-percentage_bonded)
 
     # experiment with coordination-games driven yields
     # the more people stay bonded, the greate the yield
-    buyerBonusDx3 = [x*(1-percentage_bonded) for x in slippageDx3]
+    buyerBonusDx3 = slippageDx3*(1-percentage_bonded)
 
     ## Dynamic Sales Tax, slippage scaled
     ax.plot(
@@ -136,7 +136,7 @@ def plot_fig2():
         np.divide(dx3, 200), # rescale results
         buyerBonusDx3,
         color="green",
-        lineStyle="dashed"
+        linestyle="dashed"
     )
 
     ax.axis([0, 10, -0.1, 1.1])
@@ -148,11 +148,11 @@ def plot_fig2():
         Line2D([0], [0], color='blue', lw=2,
                label=r'Curve slippage'),
         Line2D([0], [0], color='purple', lw=2,
-               label=r'Uniswap slippage', lineStyle="dotted"),
+               label=r'Uniswap slippage', linestyle="dotted"),
         Line2D([0], [0], color='green', lw=2,
                label=r'Curve sales tax'),
         Line2D([0], [0], color='green', lw=2,
-               lineStyle="dotted",
+               linestyle="dotted",
                label=r'tax diverted to buy/bonding rewards'),
     ]
     ax.legend(handles=legend_elements, loc='center left')
@@ -168,12 +168,12 @@ def plot_fig3():
 
     ## Uniswap plot
     x1 = np.linspace(0.01, 30, NUM_OBS)
-    y1 = [uniswap_y(x, 25) for x in x1]
+    y1 = uniswap_y(x1, 25)
     # Get derivatives of the curve to plot
     dydx1 = dydx_array(y1, x1)
     peg_index1 = find_peg_point(x1, y1)
     # shifts graph to start at peg point
-    dx1 = [x-5 for x in x1]
+    dx1 = x1 - 5
 
 
     ## Curve plot
@@ -181,12 +181,12 @@ def plot_fig3():
 
     x3 = np.linspace(0.01, 30, NUM_OBS)
     xp = [5,5]
-    y3 = [stableswap_y(x, xp, 90) for x in x3]
-    dx3 = [x-peg_point for x in x3]
+    y3 = trace_stableswap(x3, xp, 90)['y']
+    dx3 = x3 - peg_point
 
     peg_index3: int = find_peg_point(x3, y3)
     dydx3 = dydx_array(y3, x3)
-    dydx3_ = [get_D([y,x], 100) / (x+y) for x,y in zip(x3, y3)]
+    dydx3_ = get_D_batch([y3, x3], 100) / (x3 + y3)
 
     fig, ax = plt.subplots(figsize=[6,4])
     ax.plot(